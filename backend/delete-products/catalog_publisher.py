@@ -0,0 +1,178 @@
+import json
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+import boto3
+from botocore.exceptions import ClientError
+from db import transaction
+
+# Файлы каталога именуются хешем содержимого и никогда не меняются,
+# latest.json — короткоживущий указатель на текущий набор
+CATALOG_PREFIX = 'catalog'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+LATEST_CACHE_CONTROL = 'public, max-age=30, must-revalidate'
+
+# Файлы, на которые latest.json больше не ссылается, удаляются не сразу:
+# клиенты и CDN могут ещё держать прежний указатель
+PRUNE_AFTER = timedelta(days=1)
+
+CATEGORY_SEPARATOR = ' > '
+
+
+def get_s3_client():
+    return boto3.client('s3',
+        endpoint_url='https://bucket.poehali.dev',
+        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+    )
+
+
+def cdn_url(key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+
+
+def key_from_url(url: str) -> str:
+    return url.split('/bucket/', 1)[1]
+
+
+def encode_json(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def put_json(s3, key: str, data, cache_control: str):
+    s3.put_object(
+        Bucket='files',
+        Key=key,
+        Body=data if isinstance(data, bytes) else encode_json(data),
+        ContentType='application/json; charset=utf-8',
+        CacheControl=cache_control
+    )
+
+
+def published_latest(s3) -> dict:
+    '''Текущее содержимое latest.json; пустой dict, если каталог ещё не выкладывался'''
+    try:
+        obj = s3.get_object(Bucket='files', Key=f'{CATALOG_PREFIX}/latest.json')
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return {}
+        raise
+    return json.loads(obj['Body'].read())
+
+
+def referenced_keys(latest: dict) -> set:
+    '''Ключи S3 файлов, на которые ссылается указатель'''
+    urls = list((latest.get('sections') or {}).values())
+    if latest.get('all'):
+        urls.append(latest['all'])
+    return {key_from_url(url) for url in urls}
+
+
+def put_content_addressed(s3, name: str, data, published: set) -> str:
+    '''Кладёт JSON под ключом с хешем содержимого; уже опубликованный файл не перезаливается'''
+    body = encode_json(data)
+    key = f"{CATALOG_PREFIX}/{name}-{hashlib.sha1(body).hexdigest()[:16]}.json"
+    if key not in published:
+        put_json(s3, key, body, IMMUTABLE_CACHE_CONTROL)
+    return key
+
+
+def prune_catalog_files(s3, keep: set):
+    '''Удаляет файлы каталога (в том числе старые catalog/v<N>/), на которые давно никто не ссылается'''
+    cutoff = datetime.now(timezone.utc) - PRUNE_AFTER
+    stale = []
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket='files', Prefix=f'{CATALOG_PREFIX}/'):
+        for obj in page.get('Contents', []):
+            key = obj['Key']
+            if key == f'{CATALOG_PREFIX}/latest.json' or key in keep or obj['LastModified'] > cutoff:
+                continue
+            stale.append({'Key': key})
+    
+    # delete_objects принимает не больше 1000 ключей за раз
+    for start in range(0, len(stale), 1000):
+        s3.delete_objects(Bucket='files', Delete={'Objects': stale[start:start + 1000], 'Quiet': True})
+    if stale:
+        print(f'Catalog prune: {len(stale)} stale files removed')
+
+
+def publish_catalog(cursor, schema: str, s3=None) -> dict:
+    '''Выкладывает каталог текущей версии в S3: общий файл и по файлу на раздел верхнего уровня'''
+    s3 = s3 or get_s3_client()
+    
+    cursor.execute(f"SELECT version FROM {schema}.catalog_version WHERE id = 1")
+    row = cursor.fetchone()
+    version = row[0] if row else 0
+    
+    cursor.execute(f"""
+        SELECT id, article, name, category, dimensions, price, image_url, description, unit, image_renditions
+        FROM {schema}.products
+        ORDER BY id
+    """)
+    
+    products = []
+    sections = {}
+    for row in cursor.fetchall():
+        product = {
+            'id': row[0],
+            'article': row[1],
+            'name': row[2],
+            'category': row[3],
+            'dimensions': row[4],
+            'price': row[5],
+            'image': row[6] or '',
+            'description': row[7] or '',
+            'unit': row[8] or 'шт',
+            'renditions': row[9] or {}
+        }
+        products.append(product)
+        section = (product['category'] or '').split(CATEGORY_SEPARATOR)[0]
+        sections.setdefault(section, []).append(product)
+    
+    # Параллельная запись более новой версии не должна откатиться назад
+    previous = published_latest(s3)
+    if previous.get('version') is not None and previous['version'] > version:
+        print(f'Catalog v{version} skipped: v{previous["version"]} is already published')
+        return previous
+    published = referenced_keys(previous)
+    
+    # Файл раздела меняется, только если изменились его товары: остальные разделы
+    # остаются под прежними ключами и повторно не выгружаются
+    all_key = put_content_addressed(s3, 'all', {'products': products, 'count': len(products)}, published)
+    
+    # Кириллица в ключах S3 неудобна для CDN, поэтому имя раздела тоже хешируется
+    section_keys = {}
+    for section, section_products in sections.items():
+        section_keys[section] = put_content_addressed(
+            s3,
+            f"sections/{hashlib.sha1(section.encode('utf-8')).hexdigest()[:12]}",
+            {'section': section, 'products': section_products, 'count': len(section_products)},
+            published
+        )
+    
+    latest = {
+        'version': version,
+        'count': len(products),
+        'all': cdn_url(all_key),
+        'sections': {section: cdn_url(key) for section, key in section_keys.items()}
+    }
+    put_json(s3, f'{CATALOG_PREFIX}/latest.json', latest, LATEST_CACHE_CONTROL)
+    
+    uploaded = len({all_key, *section_keys.values()} - published)
+    print(f'Catalog v{version} published: {len(products)} products, {len(sections)} sections, {uploaded} files uploaded')
+    
+    # Файлы прежнего указателя тоже не трогаем: параллельная выкладка могла на них сослаться
+    try:
+        prune_catalog_files(s3, referenced_keys(latest) | published)
+    except Exception as prune_error:
+        print(f'Catalog prune error: {prune_error}')
+    return latest
+
+
+def publish_catalog_safely(schema: str, s3=None):
+    '''Выкладка после успешной записи в отдельной транзакции; сбой выкладки не отменяет запись'''
+    try:
+        with transaction() as cursor:
+            return publish_catalog(cursor, schema, s3)
+    except Exception as publish_error:
+        print(f'Catalog publish error: {publish_error}')
+        return None
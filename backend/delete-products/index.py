@@ -1,6 +1,22 @@
 import json
 import os
-import psycopg2
+from db import transaction, execute_prepared, bump_catalog_version
+from catalog_publisher import publish_catalog_safely
+
+
+def delete_with_tombstones_sql(schema: str, condition: str, version_param: str) -> str:
+    '''DELETE товаров с записью надгробий для дельта-синхронизации get-products (?changed_since=)'''
+    return f"""
+        WITH deleted AS (
+            DELETE FROM {schema}.products {condition} RETURNING article
+        )
+        INSERT INTO {schema}.product_tombstones (article, deleted_version)
+        SELECT article, {version_param} FROM deleted
+        ON CONFLICT (article) DO UPDATE SET
+            deleted_version = EXCLUDED.deleted_version,
+            deleted_at = CURRENT_TIMESTAMP
+    """
+
 
 def handler(event: dict, context) -> dict:
     '''Удаление товаров из базы данных по артикулам'''
@@ -45,51 +61,49 @@ def handler(event: dict, context) -> dict:
                 'isBase64Encoded': False
             }
         
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
-        cursor = conn.cursor()
         schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
-        
         deleted_count = 0
         
-        # Специальный режим: удалить ВСЕ товары
-        if len(articles) == 1 and articles[0] == '*':
-            cursor.execute(f"DELETE FROM {schema}.products")
-            deleted_count = cursor.rowcount
-        # Специальный режим: удалить по шаблону (LIKE)
-        elif len(articles) == 1 and '%' in articles[0]:
-            # Формат: "ИК-%"
-            safe_pattern = articles[0].replace("'", "''")
-            cursor.execute(f"DELETE FROM {schema}.products WHERE article LIKE '{safe_pattern}'")
-            deleted_count = cursor.rowcount
-        # Специальный режим: удалить по диапазону артикулов
-        elif len(articles) == 1 and '-' in articles[0]:
-            # Формат: "0230-0265"
-            parts = articles[0].split('-')
-            if len(parts) == 2:
-                try:
-                    start = int(parts[0])
-                    end = int(parts[1])
-                    for num in range(start, end + 1):
-                        article = str(num).zfill(4)
-                        cursor.execute(f"DELETE FROM {schema}.products WHERE article = '{article}'")
-                        deleted_count += cursor.rowcount
-                except ValueError:
-                    # Не числа - удаляем как обычный артикул
-                    for article in articles:
-                        safe_article = article.replace("'", "''")
-                        cursor.execute(f"DELETE FROM {schema}.products WHERE article = '{safe_article}'")
-                        deleted_count += cursor.rowcount
-        else:
-            # Обычное удаление по списку
-            for article in articles:
-                safe_article = article.replace("'", "''")
-                cursor.execute(f"DELETE FROM {schema}.products WHERE article = '{safe_article}'")
-                deleted_count += cursor.rowcount
+        with transaction() as cursor:
+            version = bump_catalog_version(cursor, schema)
+            
+            # Специальный режим: удалить ВСЕ товары
+            if len(articles) == 1 and articles[0] == '*':
+                cursor.execute(delete_with_tombstones_sql(schema, '', '%s'), (version,))
+                deleted_count = cursor.rowcount
+            # Специальный режим: удалить по шаблону (LIKE)
+            elif len(articles) == 1 and '%' in articles[0]:
+                # Формат: "ИК-%"
+                cursor.execute(delete_with_tombstones_sql(schema, 'WHERE article LIKE %s', '%s'), (articles[0], version))
+                deleted_count = cursor.rowcount
+            else:
+                to_delete = articles
+                # Специальный режим: удалить по диапазону артикулов
+                if len(articles) == 1 and '-' in articles[0]:
+                    # Формат: "0230-0265"
+                    parts = articles[0].split('-')
+                    if len(parts) == 2:
+                        try:
+                            start = int(parts[0])
+                            end = int(parts[1])
+                            to_delete = [str(num).zfill(4) for num in range(start, end + 1)]
+                        except ValueError:
+                            # Не числа - удаляем как обычный артикул
+                            pass
+                    else:
+                        to_delete = []
+                
+                # Весь список удаляется одним запросом с массивом в параметре
+                execute_prepared(
+                    cursor,
+                    'delete_products_by_articles',
+                    delete_with_tombstones_sql(schema, 'WHERE article = ANY($1::text[])', '$2::bigint'),
+                    (to_delete, version)
+                )
+                deleted_count = cursor.rowcount
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+        # Статические JSON каталога для CDN
+        publish_catalog_safely(schema)
         
         return {
             'statusCode': 200,
@@ -0,0 +1,96 @@
+import io
+import os
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image as PILImage, ImageChops
+
+# Готовые PNG, собранные scripts/build_branding_assets.py; если их нет в пакете,
+# ассеты один раз на процесс скачиваются с CDN и готовятся так же
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+# Имя → (URL источника, предельный размер в пикселях, убирать ли светлый фон)
+BRANDING_ASSETS = {
+    'logo': ('https://cdn.poehali.dev/files/%D0%BB%D0%BE%D0%B3%D0%BE%D0%BA%D0%BF.png', (180, 90), False),
+    # Печать и подпись печатаются ~45 мм: 600 px хватает на 300 dpi
+    'stamp': ('https://cdn.poehali.dev/projects/ffd62df4-6e6a-420c-99f5-4d24cf68fcf3/bucket/06fe805e-0379-4b53-836d-8d87ae415ec4.png', (600, 600), True),
+    'signature': ('https://cdn.poehali.dev/projects/ffd62df4-6e6a-420c-99f5-4d24cf68fcf3/bucket/d58f32e0-4045-477e-b960-e0a2f326d726.png', (600, 600), True),
+}
+
+# Пиксели светлее порога по всем каналам становятся прозрачными
+TRANSPARENCY_THRESHOLD = 240
+
+FETCH_TIMEOUT_SECONDS = 5
+
+# PNG-байты ассетов на процесс; не полученные из-за сбоя CDN пробуем снова в следующем КП
+_assets = {}
+_lock = threading.Lock()
+
+
+def make_transparent(img, threshold: int = TRANSPARENCY_THRESHOLD):
+    """Делает белый/светлый фон прозрачным (операции над каналами, без цикла по пикселям)"""
+    img = img.convert('RGBA')
+    r, g, b, alpha = img.split()
+    # Светлый пиксель — у которого минимум из r, g, b не ниже порога
+    lightest = ImageChops.darker(ImageChops.darker(r, g), b)
+    light_mask = lightest.point(lambda v: 255 if v >= threshold else 0)
+    img.putalpha(ImageChops.subtract(alpha, light_mask))
+    return img
+
+
+def prepare_asset(data: bytes, max_size: tuple, transparent: bool) -> bytes:
+    """Уменьшает ассет до размера вывода и при необходимости убирает фон: PNG"""
+    img = PILImage.open(io.BytesIO(data))
+    img.thumbnail(max_size, PILImage.Resampling.LANCZOS)
+    if transparent:
+        img = make_transparent(img)
+    out = io.BytesIO()
+    img.save(out, format='PNG', optimize=True)
+    return out.getvalue()
+
+
+def asset_path(name: str) -> str:
+    return os.path.join(ASSETS_DIR, f'{name}.png')
+
+
+def fetch_source(name: str) -> bytes:
+    url = BRANDING_ASSETS[name][0]
+    req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+    with urllib.request.urlopen(req, timeout=FETCH_TIMEOUT_SECONDS) as response:
+        return response.read()
+
+
+def _load(name: str):
+    try:
+        with open(asset_path(name), 'rb') as f:
+            return f.read()
+    except OSError:
+        pass
+    
+    try:
+        _, max_size, transparent = BRANDING_ASSETS[name]
+        print(f'Branding asset {name} is not bundled, fetching from CDN')
+        return prepare_asset(fetch_source(name), max_size, transparent)
+    except Exception as e:
+        print(f'Branding asset {name} load error: {e}')
+        return None
+
+
+def _get_assets() -> dict:
+    if len(_assets) == len(BRANDING_ASSETS):
+        return _assets
+    with _lock:
+        missing = [name for name in BRANDING_ASSETS if name not in _assets]
+        if missing:
+            # Без собранных файлов загрузки идут параллельно, а не друг за другом
+            with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                for name, data in zip(missing, executor.map(_load, missing)):
+                    if data is not None:
+                        _assets[name] = data
+    return _assets
+
+
+def asset_buffer(name: str):
+    """Свежий BytesIO с готовым PNG для ImageReader/XLImage; None, если ассет недоступен"""
+    data = _get_assets().get(name)
+    return io.BytesIO(data) if data is not None else None
@@ -1,29 +1,37 @@
-import io
-import urllib.request
+import os
+import threading
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 
+# Шрифты лежат в пакете функции (см. install_font.py): без сети и без /tmp
+FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+
+CYRILLIC_FONTS = (
+    ('DejaVuSans', 'DejaVuSans.ttf'),
+    ('DejaVuSans-Bold', 'DejaVuSans-Bold.ttf'),
+)
+
+FALLBACK_FONTS = ('Helvetica', 'Helvetica-Bold')
+
+# Результат регистрации на процесс: TTFont разбирается один раз, тёплые вызовы берут готовый
+_registered = None
+_lock = threading.Lock()
+
 
 def register_cyrillic_font():
-    """Загрузка и регистрация шрифта с поддержкой кириллицы"""
-    try:
-        # Скачиваем шрифт DejaVu Sans из CDN
-        font_url = 'https://github.com/dejavu-fonts/dejavu-fonts/raw/master/ttf/DejaVuSans.ttf'
-        font_bold_url = 'https://github.com/dejavu-fonts/dejavu-fonts/raw/master/ttf/DejaVuSans-Bold.ttf'
-        
-        # Загружаем обычный шрифт
-        req = urllib.request.Request(font_url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req, timeout=10) as response:
-            font_data = io.BytesIO(response.read())
-            pdfmetrics.registerFont(TTFont('DejaVuSans', font_data))
-        
-        # Загружаем жирный шрифт
-        req_bold = urllib.request.Request(font_bold_url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req_bold, timeout=10) as response:
-            font_bold_data = io.BytesIO(response.read())
-            pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', font_bold_data))
-        
-        return 'DejaVuSans', 'DejaVuSans-Bold'
-    except Exception as e:
-        print(f'Failed to load DejaVu fonts: {e}')
-        return 'Helvetica', 'Helvetica-Bold'
+    """Регистрация шрифта с поддержкой кириллицы: (обычный, жирный)"""
+    global _registered
+    if _registered is not None:
+        return _registered
+    
+    with _lock:
+        if _registered is None:
+            try:
+                for name, filename in CYRILLIC_FONTS:
+                    pdfmetrics.registerFont(TTFont(name, os.path.join(FONTS_DIR, filename)))
+                _registered = tuple(name for name, _ in CYRILLIC_FONTS)
+            except Exception as e:
+                # Без шрифта кириллица не отрисуется — это ошибка сборки пакета, а не сети
+                print(f'Failed to load DejaVu fonts from {FONTS_DIR}: {e}')
+                _registered = FALLBACK_FONTS
+    return _registered
@@ -0,0 +1,179 @@
+import io
+import os
+import time
+import urllib.parse
+import urllib.request
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image as PILImage
+import rendition_cache
+
+# Сколько картинок качаем одновременно и сколько ждём одну
+FETCH_WORKERS = 8
+FETCH_TIMEOUT_SECONDS = 5
+
+# Общий предел ожидания картинок: КП без части картинок лучше, чем таймаут функции
+PREFETCH_DEADLINE_SECONDS = 20
+
+# С какого числа картинок декодировать и ужимать их в отдельных процессах
+PROCESS_POOL_MIN_IMAGES = 16
+
+# Предел процессов: каждый держит свой интерпретатор с Pillow, а память экземпляра общая
+MAX_PROCESS_WORKERS = 4
+
+# Сколько ждём картинку из процесса: остаток дедлайна нужен на подготовку в потоке,
+# если процесс завис или медленно стартует
+PROCESS_RESULT_TIMEOUT_SECONDS = 5
+
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+# Как картинка ляжет в документ: предельная сторона и параметры JPEG
+XLSX_IMAGE_OPTIONS = {'max_dim': 1200, 'quality': 100, 'optimize': False, 'dpi': (300, 300)}
+PDF_IMAGE_OPTIONS = {'max_dim': 200, 'quality': 40, 'optimize': True, 'dpi': None}
+
+_process_pool = None
+_process_pool_failed = False
+
+
+def quote_url(url: str) -> str:
+    '''Кодирует путь URL (кириллица в именах файлов CDN)'''
+    parsed = urllib.parse.urlparse(url)
+    encoded_path = urllib.parse.quote(parsed.path, safe='/%')
+    return urllib.parse.urlunparse((
+        parsed.scheme, parsed.netloc, encoded_path,
+        parsed.params, parsed.query, parsed.fragment
+    ))
+
+
+def download(url: str) -> bytes:
+    req = urllib.request.Request(quote_url(url), headers={'User-Agent': 'Mozilla/5.0'})
+    with urllib.request.urlopen(req, timeout=FETCH_TIMEOUT_SECONDS) as response:
+        data = response.read(MAX_IMAGE_BYTES + 1)
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError(f'Изображение больше {MAX_IMAGE_BYTES} байт')
+    return data
+
+
+def prepare(data: bytes, max_dim: int, quality: int, optimize: bool, dpi) -> tuple:
+    '''Декодирует картинку, кладёт прозрачность на белый фон и ужимает: (JPEG, ширина, высота)'''
+    pil_img = PILImage.open(io.BytesIO(data))
+    
+    # Конвертируем в RGB если нужно
+    if pil_img.mode in ('RGBA', 'LA', 'P'):
+        rgb_img = PILImage.new('RGB', pil_img.size, (255, 255, 255))
+        if pil_img.mode == 'P':
+            pil_img = pil_img.convert('RGBA')
+        rgb_img.paste(pil_img, mask=pil_img.split()[-1] if pil_img.mode in ('RGBA', 'LA') else None)
+        pil_img = rgb_img
+    elif pil_img.mode != 'RGB':
+        pil_img = pil_img.convert('RGB')
+    
+    # Только уменьшаем: thumbnail не трогает картинки меньше предела
+    pil_img.thumbnail((max_dim, max_dim), PILImage.Resampling.LANCZOS)
+    
+    save_args = {'quality': quality, 'optimize': optimize}
+    if dpi:
+        save_args['dpi'] = dpi
+    output = io.BytesIO()
+    pil_img.save(output, 'JPEG', **save_args)
+    return output.getvalue(), pil_img.width, pil_img.height
+
+
+def _get_process_pool():
+    '''Пул процессов на экземпляр функции; None, если среда их не позволяет (нет /dev/shm и т.п.)'''
+    global _process_pool, _process_pool_failed
+    if _process_pool is None and not _process_pool_failed:
+        # Считаем доступные процессу ядра (квота контейнера), а не все ядра хоста
+        try:
+            available = len(os.sched_getaffinity(0))
+        except AttributeError:
+            available = os.cpu_count() or 1
+        workers = min(available, MAX_PROCESS_WORKERS)
+        if workers < 2:
+            _process_pool_failed = True
+            return None
+        try:
+            # spawn, а не fork: форк процесса с живыми потоками загрузки небезопасен
+            _process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        except (OSError, NotImplementedError, ImportError) as e:
+            print(f'Process pool unavailable, decoding in threads: {e}')
+            _process_pool_failed = True
+    return _process_pool
+
+
+def _discard_process_pool(pool):
+    '''Сломанный пул больше не отдаём: следующий КП создаст новый'''
+    global _process_pool
+    if _process_pool is pool:
+        _process_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ImagePrefetch:
+    '''Параллельная загрузка и подготовка картинок КП до вёрстки; вёрстка забирает готовые через get'''
+    
+    def __init__(self, urls, options: dict, ready=None):
+        self.options = options
+        # Исходный URL → готовая рендиция с теми же параметрами, сгенерированная при загрузке
+        self.ready = ready or {}
+        unique_urls = [url for url in dict.fromkeys(urls) if url and url.startswith('http')]
+        self.deadline = time.monotonic() + PREFETCH_DEADLINE_SECONDS
+        
+        self.processes = _get_process_pool() if len(unique_urls) >= PROCESS_POOL_MIN_IMAGES else None
+        self.executor = ThreadPoolExecutor(max_workers=max(1, min(FETCH_WORKERS, len(unique_urls))))
+        self.futures = {url: self.executor.submit(self._load, url) for url in unique_urls}
+        # Потоки сами завершатся по таймаутам сокета; ответ функции их не ждёт
+        self.executor.shutdown(wait=False)
+    
+    def _load(self, url: str) -> tuple:
+        # Популярные товары повторяются из КП в КП: готовая рендиция не требует ни сети, ни Pillow
+        cached = rendition_cache.get(url, self.options)
+        if cached is not None:
+            return cached
+        
+        ready_url = self.ready.get(url)
+        if ready_url:
+            try:
+                data = download(ready_url)
+                width, height = PILImage.open(io.BytesIO(data)).size
+                # Рендиция и так лежит на CDN, в S3-кэш её не дублируем
+                rendition_cache.put(url, self.options, data, shared=False)
+                return data, width, height
+            except Exception as e:
+                print(f'Ready rendition {ready_url} failed, using original: {e}')
+        
+        data = download(url)
+        result = None
+        processes = self.processes
+        if processes is not None:
+            # Процесс spawn может долго стартовать или зависнуть: ждём не дольше дедлайна КП
+            timeout = max(min(PROCESS_RESULT_TIMEOUT_SECONDS, self.deadline - time.monotonic()), 0)
+            try:
+                future = processes.submit(prepare, data, **self.options)
+                result = future.result(timeout=timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                # Остальные картинки этого КП не ждут зависший пул
+                self.processes = None
+                print(f'Process pool timed out on {url}, decoding in thread')
+            except BrokenProcessPool as e:
+                self.processes = None
+                _discard_process_pool(processes)
+                print(f'Process pool broken, decoding in thread: {e}')
+        if result is None:
+            result = prepare(data, **self.options)
+        
+        rendition_cache.put(url, self.options, result[0])
+        return result
+    
+    def get(self, url: str):
+        '''Готовая картинка (JPEG, ширина, высота) или None, если не загрузилась или не успела'''
+        future = self.futures.get(url)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=max(self.deadline - time.monotonic(), 0))
+        except Exception as e:
+            print(f'Failed to load image {url}: {e}')
+            return None
@@ -9,49 +9,63 @@ from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.drawing.image import Image as XLImage
 from openpyxl.utils import get_column_letter
-import urllib.request
-import urllib.parse
-from PIL import Image as PILImage
-import psycopg2
+from db import transaction, execute_prepared
+from compression import negotiate_encoding, encode_response
+from image_prefetch import ImagePrefetch, XLSX_IMAGE_OPTIONS, PDF_IMAGE_OPTIONS
+from branding import asset_buffer
+import rendition_cache
 
 def get_next_kp_number():
     """Получить следующий номер КП из счетчика с автосбросом в начале года"""
     try:
         current_year = datetime.now().year
-        database_url = os.environ.get('DATABASE_URL')
-        
-        conn = psycopg2.connect(database_url)
-        cur = conn.cursor()
-        
-        # Получаем текущий счетчик
-        cur.execute("SELECT year, counter FROM kp_counter WHERE id = 1")
-        row = cur.fetchone()
-        
-        if row:
-            saved_year, counter = row
-            # Если год изменился, сбрасываем счетчик
-            if saved_year != current_year:
+        with transaction() as cur:
+            # Получаем текущий счетчик
+            cur.execute("SELECT year, counter FROM kp_counter WHERE id = 1 FOR UPDATE")
+            row = cur.fetchone()
+            
+            if row:
+                saved_year, counter = row
+                # Если год изменился, сбрасываем счетчик
+                if saved_year != current_year:
+                    counter = 0
+            else:
                 counter = 0
-        else:
-            counter = 0
-        
-        counter += 1
-        
-        # Обновляем счетчик в базе
-        cur.execute(
-            "UPDATE kp_counter SET year = %s, counter = %s, updated_at = CURRENT_TIMESTAMP WHERE id = 1",
-            (current_year, counter)
-        )
-        conn.commit()
-        
-        cur.close()
-        conn.close()
+            
+            counter += 1
+            
+            # Обновляем счетчик в базе
+            cur.execute(
+                "UPDATE kp_counter SET year = %s, counter = %s, updated_at = CURRENT_TIMESTAMP WHERE id = 1",
+                (current_year, counter)
+            )
         
         return counter
     except Exception as e:
         print(f'Error getting KP number: {e}')
         return 1
 
+
+def get_ready_images(products, rendition: str) -> dict:
+    """Рендиции для КП, сгенерированные при загрузке картинок: {URL картинки товара: URL рендиции}"""
+    articles = list({p['article'] for p in products if p.get('article') and p.get('image')})
+    if not articles:
+        return {}
+    try:
+        schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+        with transaction() as cur:
+            execute_prepared(cur, 'renditions_by_articles', f"""
+                SELECT image_url, image_renditions
+                FROM {schema}.products
+                WHERE article = ANY($1::text[]) AND image_renditions IS NOT NULL
+            """, (articles,))
+            rows = cur.fetchall()
+    except Exception as e:
+        print(f'Error loading image renditions: {e}')
+        return {}
+    # Ключ — текущий image_url товара: если в корзине устаревшая картинка, рендиция к ней не подойдёт
+    return {image_url: renditions[rendition] for image_url, renditions in rows if renditions.get(rendition)}
+
 def handler(event, context):
     """Генерация Excel или PDF файла с коммерческим предложением"""
     print(f'Function started. Memory: {context.memory_limit_in_mb} MB')
@@ -86,6 +100,15 @@ def handler(event, context):
         print(f'Discount amount: {discount_amount}')
         print(f'Add stamp: {add_stamp}')
         
+        # Картинки товаров качаются параллельно, пока берём номер КП и строим шапку;
+        # где есть готовая рендиция с загрузки, качается она вместо оригинала
+        rendition = 'pdf' if file_format == 'pdf' else 'xlsx'
+        images = ImagePrefetch(
+            [p.get('image') for p in products],
+            PDF_IMAGE_OPTIONS if file_format == 'pdf' else XLSX_IMAGE_OPTIONS,
+            get_ready_images(products, rendition)
+        )
+        
         # Получаем номер КП
         kp_number = get_next_kp_number()
         
@@ -96,12 +119,12 @@ def handler(event, context):
             pdf_content = generate_pdf_reportlab(
                 products, address, installation_percent, installation_cost,
                 delivery_cost, hide_installation, hide_delivery, kp_number,
-                discount_percent, discount_amount, add_stamp
+                discount_percent, discount_amount, add_stamp, images
             )
             
             print(f'PDF generated, size: {len(pdf_content)} bytes')
             
-            return {
+            return encode_response({
                 'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/pdf',
@@ -110,7 +133,7 @@ def handler(event, context):
                 },
                 'body': base64.b64encode(pdf_content).decode('utf-8'),
                 'isBase64Encoded': True
-            }
+            }, negotiate_encoding(event))
         
         # Генерация Excel (по умолчанию)
         wb = Workbook()
@@ -125,34 +148,11 @@ def handler(event, context):
         # Отступ одной строки сверху
         current_row = 2
         
-        # Логотип (левый верхний угол) - оптимизированная загрузка
+        # Логотип (левый верхний угол) - уже ужатый PNG из кэша ассетов процесса
         try:
-            print('Loading logo...')
-            logo_url = 'https://cdn.poehali.dev/files/%D0%BB%D0%BE%D0%B3%D0%BE%D0%BA%D0%BF.png'
-            req = urllib.request.Request(logo_url, headers={'User-Agent': 'Mozilla/5.0'})
-            with urllib.request.urlopen(req, timeout=3) as response:
-                logo_data = response.read()
-                
-                # Открываем и сразу ресайзим для экономии памяти
-                pil_logo = PILImage.open(io.BytesIO(logo_data))
-                
-                # Целевые размеры
-                target_width = 180
-                target_height = 90
-                
-                # Ресайзим изображение сразу
-                pil_logo.thumbnail((target_width, target_height), PILImage.Resampling.LANCZOS)
-                
-                # Сохраняем в буфер
-                logo_buffer = io.BytesIO()
-                pil_logo.save(logo_buffer, format='PNG', optimize=True)
-                logo_buffer.seek(0)
-                
-                logo_img = XLImage(logo_buffer)
-                logo_img.width = pil_logo.width
-                logo_img.height = pil_logo.height
-                
-                ws.add_image(logo_img, 'B2')
+            logo_buffer = asset_buffer('logo')
+            if logo_buffer is not None:
+                ws.add_image(XLImage(logo_buffer), 'B2')
                 print('Logo loaded successfully')
         except Exception as e:
             print(f'Failed to load logo: {e}')
@@ -329,71 +329,37 @@ def handler(event, context):
             cell.border = thin_border
             cell.font = Font(name='Calibri', size=11)
             
-            # Рисунок - оптимизированная загрузка
-            if product.get('image') and product['image'].startswith('http'):
+            # Рисунок - уже загружен и ужат предзагрузкой
+            prepared = images.get(product.get('image'))
+            if prepared:
                 try:
-                    print(f'Loading product image {idx}...')
-                    # Энкодим URL для корректной работы с кириллицей
-                    image_url = product['image']
+                    img_bytes, img_width, img_height = prepared
+                    img = XLImage(io.BytesIO(img_bytes))
+                    display_width = 130
+                    display_height = int(img_height * (display_width / img_width)) if img_width > 0 else 90
+                    if display_height > 90:
+                        display_height = 90
+                        display_width = int(img_width * (display_height / img_height)) if img_height > 0 else 130
+                    img.width = display_width
+                    img.height = display_height
+                    
+                    from openpyxl.drawing.spreadsheet_drawing import AnchorMarker, TwoCellAnchor
                     
-                    # Парсим URL
-                    parsed = urllib.parse.urlparse(image_url)
-                    encoded_path = urllib.parse.quote(parsed.path, safe='/')
-                    safe_url = urllib.parse.urlunparse((
-                        parsed.scheme, parsed.netloc, encoded_path,
-                        parsed.params, parsed.query, parsed.fragment
-                    ))
+                    col_width_pixels = 140
+                    row_height_pixels = 100
                     
-                    req = urllib.request.Request(safe_url, headers={'User-Agent': 'Mozilla/5.0'})
-                    with urllib.request.urlopen(req, timeout=3) as response:
-                        img_data = response.read()
-                        
-                        # Открываем с максимальным качеством
-                        pil_img = PILImage.open(io.BytesIO(img_data))
-                        
-                        # Конвертируем в RGB если нужно
-                        if pil_img.mode in ('RGBA', 'LA', 'P'):
-                            rgb_img = PILImage.new('RGB', pil_img.size, (255, 255, 255))
-                            if pil_img.mode == 'P':
-                                pil_img = pil_img.convert('RGBA')
-                            rgb_img.paste(pil_img, mask=pil_img.split()[-1] if pil_img.mode == 'RGBA' else None)
-                            pil_img = rgb_img
-                        
-                        # Высокое разрешение — не уменьшаем, только если изображение слишком большое
-                        max_dim = 1200
-                        if pil_img.width > max_dim or pil_img.height > max_dim:
-                            pil_img.thumbnail((max_dim, max_dim), PILImage.Resampling.LANCZOS)
-                        
-                        img_buffer = io.BytesIO()
-                        pil_img.save(img_buffer, format='JPEG', quality=100, optimize=False, dpi=(300, 300))
-                        img_buffer.seek(0)
-                        
-                        img = XLImage(img_buffer)
-                        display_width = 130
-                        display_height = int(pil_img.height * (display_width / pil_img.width)) if pil_img.width > 0 else 90
-                        if display_height > 90:
-                            display_height = 90
-                            display_width = int(pil_img.width * (display_height / pil_img.height)) if pil_img.height > 0 else 130
-                        img.width = display_width
-                        img.height = display_height
-                        
-                        from openpyxl.drawing.spreadsheet_drawing import AnchorMarker, TwoCellAnchor
-                        
-                        col_width_pixels = 140
-                        row_height_pixels = 100
-                        
-                        offset_x = int((col_width_pixels - display_width) / 2 * 9525)
-                        offset_y = int((row_height_pixels - display_height) / 2 * 9525)
-                        
-                        anchor = TwoCellAnchor()
-                        anchor._from = AnchorMarker(col=2, colOff=max(0, offset_x), row=current_row-1, rowOff=max(0, offset_y))
-                        anchor.to = AnchorMarker(col=2, colOff=max(0, offset_x) + display_width * 9525, row=current_row-1, rowOff=max(0, offset_y) + display_height * 9525)
-                        img.anchor = anchor
-                        
-                        ws.add_image(img)
-                        print(f'Product image {idx} loaded')
+                    offset_x = int((col_width_pixels - display_width) / 2 * 9525)
+                    offset_y = int((row_height_pixels - display_height) / 2 * 9525)
+                    
+                    anchor = TwoCellAnchor()
+                    anchor._from = AnchorMarker(col=2, colOff=max(0, offset_x), row=current_row-1, rowOff=max(0, offset_y))
+                    anchor.to = AnchorMarker(col=2, colOff=max(0, offset_x) + display_width * 9525, row=current_row-1, rowOff=max(0, offset_y) + display_height * 9525)
+                    img.anchor = anchor
+                    
+                    ws.add_image(img)
+                    print(f'Product image {idx} loaded')
                 except Exception as e:
-                    print(f'Failed to load image {idx}: {e}')
+                    print(f'Failed to place image {idx}: {e}')
             
             cell = ws.cell(row=current_row, column=3, value='')
             cell.border = thin_border
@@ -630,7 +596,8 @@ def handler(event, context):
         excel_data = output.read()
         print(f'Excel file saved, size: {len(excel_data)} bytes')
         
-        return {
+        # xlsx — уже zip-архив, encode_response отдаст его без повторного сжатия
+        return encode_response({
             'statusCode': 200,
             'headers': {
                 'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
@@ -639,7 +606,7 @@ def handler(event, context):
             },
             'body': base64.b64encode(excel_data).decode('utf-8'),
             'isBase64Encoded': True
-        }
+        }, negotiate_encoding(event))
         
     except Exception as e:
         import traceback
@@ -652,4 +619,7 @@ def handler(event, context):
                 'Access-Control-Allow-Origin': '*'
             },
             'body': json.dumps({'error': str(e), 'details': error_details})
-        }
\ No newline at end of file
+        }
+    finally:
+        # Рендиции, выгружаемые в общий кэш, должны уйти до заморозки экземпляра
+        rendition_cache.flush()
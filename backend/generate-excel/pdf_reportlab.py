@@ -1,82 +1,43 @@
 import io
 import os
-import urllib.request
-import urllib.parse
 from datetime import datetime
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.lib.units import mm
 from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.platypus import Table, TableStyle, Image as RLImage, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import Paragraph
+from reportlab.lib.utils import ImageReader
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-from PIL import Image as PILImage
+from image_prefetch import ImagePrefetch, PDF_IMAGE_OPTIONS
+from font_helper import register_cyrillic_font
+from branding import asset_buffer
 
 
 def generate_pdf_reportlab(products, address, installation_percent, installation_cost, delivery_cost, 
-                           hide_installation, hide_delivery, kp_number, discount_percent=0, discount_amount=0, add_stamp=True):
+                           hide_installation, hide_delivery, kp_number, discount_percent=0, discount_amount=0, add_stamp=True,
+                           images=None):
     """Генерация PDF с использованием ReportLab (кириллица через DejaVu)"""
     print(f'PDF generation started for {len(products)} products')
+    if images is None:
+        # Картинки грузятся параллельно с шапкой, строки таблицы берут готовые
+        images = ImagePrefetch([p.get('image') for p in products], PDF_IMAGE_OPTIONS)
     buffer = io.BytesIO()
     c = canvas.Canvas(buffer, pagesize=A4)
     width, height = A4
     
-    # Загружаем шрифт DejaVu Sans для кириллицы
-    try:
-        # Скачиваем шрифт DejaVu Sans (аналог Calibri)
-        font_url = 'https://cdn.jsdelivr.net/npm/dejavu-fonts-ttf@2.37.3/ttf/DejaVuSans.ttf'
-        req = urllib.request.Request(font_url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req, timeout=3) as response:
-            font_data = response.read()
-            font_path = '/tmp/DejaVuSans.ttf'
-            with open(font_path, 'wb') as f:
-                f.write(font_data)
-        
-        pdfmetrics.registerFont(TTFont('DejaVuSans', font_path))
-        
-        # Жирный шрифт
-        font_url_bold = 'https://cdn.jsdelivr.net/npm/dejavu-fonts-ttf@2.37.3/ttf/DejaVuSans-Bold.ttf'
-        req_bold = urllib.request.Request(font_url_bold, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req_bold, timeout=3) as response:
-            font_bold_data = response.read()
-            font_bold_path = '/tmp/DejaVuSans-Bold.ttf'
-            with open(font_bold_path, 'wb') as f:
-                f.write(font_bold_data)
-        
-        pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', font_bold_path))
-        
-        font_name = 'DejaVuSans'
-        font_name_bold = 'DejaVuSans-Bold'
-    except Exception as e:
-        print(f'Font loading error: {e}')
-        font_name = 'Helvetica'
-        font_name_bold = 'Helvetica-Bold'
+    # DejaVu Sans из пакета функции, зарегистрирован один раз на процесс
+    font_name, font_name_bold = register_cyrillic_font()
     
     y_pos = height - 15*mm
     
-    # Логотип (левый верхний угол)
+    # Логотип (левый верхний угол) - уже ужатый PNG из кэша ассетов процесса
     try:
-        logo_url = 'https://cdn.poehali.dev/files/логокп.png'
-        parsed = urllib.parse.urlparse(logo_url)
-        encoded_path = urllib.parse.quote(parsed.path, safe='/')
-        safe_url = urllib.parse.urlunparse((
-            parsed.scheme, parsed.netloc, encoded_path,
-            parsed.params, parsed.query, parsed.fragment
-        ))
-        
-        req = urllib.request.Request(safe_url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req, timeout=3) as response:
-            logo_data = io.BytesIO(response.read())
-            pil_logo = PILImage.open(logo_data)
-            # Ресайзим для экономии памяти
-            pil_logo.thumbnail((180, 90), PILImage.Resampling.LANCZOS)
-            temp_logo = '/tmp/logo.png'
-            pil_logo.save(temp_logo, 'PNG', optimize=True)
+        logo_buffer = asset_buffer('logo')
+        if logo_buffer is not None:
             # Логотип: 180x90 pts (аналог XLSX)
-            c.drawImage(temp_logo, 10*mm, y_pos - 22*mm, width=60*mm, height=25*mm, preserveAspectRatio=True, mask='auto')
+            c.drawImage(ImageReader(logo_buffer), 10*mm, y_pos - 22*mm, width=60*mm, height=25*mm, preserveAspectRatio=True, mask='auto')
     except Exception as e:
         print(f'Logo error: {e}')
     
@@ -199,38 +160,9 @@ def generate_pdf_reportlab(products, address, installation_percent, installation
         
         # Добавляем изображение если есть
         img_placeholder = ''
-        if product.get('image', '').startswith('http'):
-            try:
-                image_url = product['image']
-                parsed = urllib.parse.urlparse(image_url)
-                encoded_path = urllib.parse.quote(parsed.path, safe='/')
-                safe_url = urllib.parse.urlunparse((
-                    parsed.scheme, parsed.netloc, encoded_path,
-                    parsed.params, parsed.query, parsed.fragment
-                ))
-                
-                req = urllib.request.Request(safe_url, headers={'User-Agent': 'Mozilla/5.0'})
-                with urllib.request.urlopen(req, timeout=5) as response:
-                    img_data = io.BytesIO(response.read())
-                    pil_img = PILImage.open(img_data)
-                    
-                    # Конвертируем в RGB если нужно
-                    if pil_img.mode in ('RGBA', 'LA', 'P'):
-                        rgb_img = PILImage.new('RGB', pil_img.size, (255, 255, 255))
-                        if pil_img.mode == 'P':
-                            pil_img = pil_img.convert('RGBA')
-                        rgb_img.paste(pil_img, mask=pil_img.split()[-1] if pil_img.mode == 'RGBA' else None)
-                        pil_img = rgb_img
-                    
-                    # Уменьшаем до минимального размера для PDF
-                    pil_img.thumbnail((200, 200), PILImage.Resampling.LANCZOS)
-                    
-                    temp_img = f'/tmp/prod_{idx}.jpg'
-                    pil_img.save(temp_img, 'JPEG', quality=40, optimize=True)
-                    img_placeholder = RLImage(temp_img, width=38*mm, height=28*mm)
-            except Exception as e:
-                print(f'Image {idx} error: {e}')
-                img_placeholder = ''
+        prepared = images.get(product.get('image'))
+        if prepared:
+            img_placeholder = RLImage(io.BytesIO(prepared[0]), width=38*mm, height=28*mm)
         
         unit = product.get('unit', 'шт')
         table_data.append([
@@ -442,9 +374,6 @@ def generate_pdf_reportlab(products, address, installation_percent, installation
     y_pos -= 14*mm
     
     # Строка подписи с печатью и подписью
-    from reportlab.lib.utils import ImageReader
-    from io import BytesIO as _BytesIO
-    
     c.setFont(font_name, 11)
     c.drawString(30*mm, y_pos, 'Индивидуальный')
     y_pos -= 5*mm
@@ -459,49 +388,26 @@ def generate_pdf_reportlab(products, address, installation_percent, installation
     c.setFont(font_name, 11)
     c.drawString(line_x_end + 2*mm, y_pos, '/Пронин Р.О./')
     
-    def make_transparent(img_data, threshold=240):
-        """Делает белый/светлый фон прозрачным"""
-        img = PILImage.open(img_data).convert('RGBA')
-        data = img.getdata()
-        new_data = []
-        for r, g, b, a in data:
-            if r >= threshold and g >= threshold and b >= threshold:
-                new_data.append((r, g, b, 0))
-            else:
-                new_data.append((r, g, b, a))
-        img.putdata(new_data)
-        out = _BytesIO()
-        img.save(out, format='PNG')
-        out.seek(0)
-        return out
-
-    # Загружаем и размещаем печать (сдвинута правее, прозрачный фон)
-    stamp_url = 'https://cdn.poehali.dev/projects/ffd62df4-6e6a-420c-99f5-4d24cf68fcf3/bucket/06fe805e-0379-4b53-836d-8d87ae415ec4.png'
+    # Печать (сдвинута правее) и подпись (поверх линии): фон уже прозрачный, см. branding.py
     try:
-        stamp_response = urllib.request.urlopen(stamp_url, timeout=10)
-        stamp_data = _BytesIO(stamp_response.read())
-        stamp_data_transparent = make_transparent(stamp_data)
-        stamp_img = ImageReader(stamp_data_transparent)
-        stamp_w = 46*mm
-        stamp_h = 42*mm
-        stamp_x = 65*mm
-        stamp_y = y_pos - stamp_h + 10*mm
-        c.drawImage(stamp_img, stamp_x, stamp_y, width=stamp_w, height=stamp_h, mask='auto')
+        stamp_buffer = asset_buffer('stamp')
+        if stamp_buffer is not None:
+            stamp_w = 46*mm
+            stamp_h = 42*mm
+            stamp_x = 65*mm
+            stamp_y = y_pos - stamp_h + 10*mm
+            c.drawImage(ImageReader(stamp_buffer), stamp_x, stamp_y, width=stamp_w, height=stamp_h, mask='auto')
     except Exception as e:
         print(f'Stamp load error: {e}')
     
-    # Загружаем и размещаем подпись (поверх линии, прозрачный фон)
-    sign_url = 'https://cdn.poehali.dev/projects/ffd62df4-6e6a-420c-99f5-4d24cf68fcf3/bucket/d58f32e0-4045-477e-b960-e0a2f326d726.png'
     try:
-        sign_response = urllib.request.urlopen(sign_url, timeout=10)
-        sign_data = _BytesIO(sign_response.read())
-        sign_data_transparent = make_transparent(sign_data)
-        sign_img = ImageReader(sign_data_transparent)
-        sign_w = 40*mm
-        sign_h = 22*mm
-        sign_x = 85*mm
-        sign_y = y_pos - sign_h + 18*mm
-        c.drawImage(sign_img, sign_x, sign_y, width=sign_w, height=sign_h, mask='auto')
+        sign_buffer = asset_buffer('signature')
+        if sign_buffer is not None:
+            sign_w = 40*mm
+            sign_h = 22*mm
+            sign_x = 85*mm
+            sign_y = y_pos - sign_h + 18*mm
+            c.drawImage(ImageReader(sign_buffer), sign_x, sign_y, width=sign_w, height=sign_h, mask='auto')
     except Exception as e:
         print(f'Sign load error: {e}')
     
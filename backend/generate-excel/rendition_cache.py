@@ -0,0 +1,176 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import boto3
+from PIL import Image as PILImage
+
+# Меняется вместе с алгоритмом prepare: старые рендиции просто перестанут находиться
+RENDITION_VERSION = 1
+
+# Локальный уровень в /tmp живёт, пока жив экземпляр функции
+DISK_DIR = '/tmp/kp-image-cache'
+DISK_BUDGET_BYTES = 256 * 1024 * 1024
+
+# Общий для всех экземпляров уровень в S3; без ключей доступа он отключён
+S3_BUCKET = 'files'
+S3_PREFIX = 'kp-image-cache'
+
+# Промах S3 помним недолго: новые картинки КП не ходят в S3 на каждой генерации,
+# а рендиция, выгруженная другим экземпляром, найдётся после истечения срока
+MISS_TTL_SECONDS = 60
+MAX_MISSES = 10000
+
+# Сколько handler ждёт фоновые выгрузки перед ответом
+FLUSH_TIMEOUT_SECONDS = 5
+
+_s3 = None
+_s3_lock = threading.Lock()
+
+# Ключ → monotonic-время, до которого S3 не спрашиваем
+_misses = {}
+
+# Выгрузка в S3 идёт в фоне и не задерживает сборку КП; между вызовами экземпляр
+# может быть заморожен, поэтому handler дожидается её через flush
+_uploads = ThreadPoolExecutor(max_workers=2)
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def cache_key(url: str, options: dict) -> str:
+    '''Ключ рендиции: исходный URL (в каталоге он уникален для каждой загрузки) и параметры ужатия'''
+    params = '&'.join(f'{name}={options[name]}' for name in sorted(options))
+    raw = f'v{RENDITION_VERSION}\n{url}\n{params}\nformat=jpeg'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _get_s3():
+    global _s3
+    if not os.environ.get('AWS_ACCESS_KEY_ID'):
+        return None
+    with _s3_lock:
+        if _s3 is None:
+            _s3 = boto3.client('s3',
+                endpoint_url='https://bucket.poehali.dev',
+                aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+                aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+            )
+    return _s3
+
+
+def _disk_path(key: str) -> str:
+    return os.path.join(DISK_DIR, f'{key}.jpg')
+
+
+def _with_size(data: bytes) -> tuple:
+    '''(JPEG, ширина, высота); размер читается из заголовка без декодирования'''
+    width, height = PILImage.open(io.BytesIO(data)).size
+    return data, width, height
+
+
+def _write_disk(key: str, data: bytes):
+    '''Запись через временный файл и os.replace: параллельный читатель не увидит файл наполовину'''
+    os.makedirs(DISK_DIR, exist_ok=True)
+    path = _disk_path(key)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _trim_disk():
+    '''Удаляет самые давно использованные рендиции, пока кэш не уложится в бюджет'''
+    try:
+        paths = [os.path.join(DISK_DIR, name) for name in os.listdir(DISK_DIR)]
+        stats = [(path, os.stat(path)) for path in paths]
+    except OSError:
+        return
+    total = sum(st.st_size for _, st in stats)
+    if total <= DISK_BUDGET_BYTES:
+        return
+    for path, st in sorted(stats, key=lambda item: item[1].st_mtime):
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= st.st_size
+        if total <= DISK_BUDGET_BYTES:
+            break
+
+
+def _upload(key: str, data: bytes):
+    try:
+        _get_s3().put_object(
+            Bucket=S3_BUCKET,
+            Key=f'{S3_PREFIX}/{key}.jpg',
+            Body=data,
+            ContentType='image/jpeg'
+        )
+    except Exception as e:
+        print(f'Rendition upload to S3 failed: {e}')
+
+
+def get(url: str, options: dict):
+    '''Готовая рендиция (JPEG, ширина, высота): сначала /tmp, затем S3; None, если её нигде нет'''
+    key = cache_key(url, options)
+    path = _disk_path(key)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        # mtime — метка последнего использования для вытеснения
+        os.utime(path)
+        return _with_size(data)
+    except (OSError, ValueError):
+        pass
+    
+    s3 = _get_s3()
+    if s3 is None:
+        return None
+    if _misses.get(key, 0) > time.monotonic():
+        return None
+    try:
+        data = s3.get_object(Bucket=S3_BUCKET, Key=f'{S3_PREFIX}/{key}.jpg')['Body'].read()
+        result = _with_size(data)
+    except Exception:
+        if len(_misses) >= MAX_MISSES:
+            _misses.clear()
+        _misses[key] = time.monotonic() + MISS_TTL_SECONDS
+        return None
+    
+    try:
+        _write_disk(key, data)
+        _trim_disk()
+    except OSError as e:
+        print(f'Rendition cache disk write failed: {e}')
+    return result
+
+
+def put(url: str, options: dict, data: bytes, shared: bool = True):
+    '''Сохраняет рендицию в /tmp и (если shared) в фоне выгружает в S3'''
+    key = cache_key(url, options)
+    try:
+        _write_disk(key, data)
+        _trim_disk()
+    except OSError as e:
+        print(f'Rendition cache disk write failed: {e}')
+    _misses.pop(key, None)
+    if shared and _get_s3() is not None:
+        future = _uploads.submit(_upload, key, data)
+        with _pending_lock:
+            _pending.add(future)
+        future.add_done_callback(_forget)
+
+
+def _forget(future):
+    with _pending_lock:
+        _pending.discard(future)
+
+
+def flush(timeout: float = FLUSH_TIMEOUT_SECONDS):
+    '''Ждёт фоновые выгрузки в S3 (не дольше timeout), чтобы они не замёрзли вместе с экземпляром'''
+    with _pending_lock:
+        pending = list(_pending)
+    if pending:
+        wait(pending, timeout=timeout)
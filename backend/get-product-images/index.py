@@ -1,10 +1,64 @@
 import json
-import os
-import psycopg2
+import hashlib
+from db import transaction, execute_prepared
+
+# Галерея меняется только вместе с catalog_version, поэтому ответ можно
+# держать в кэше и перепроверять по ETag
+CACHE_CONTROL = 'public, max-age=60, stale-while-revalidate=600'
+
+# Максимум артикулов в одном пакетном запросе (?articles=)
+MAX_BATCH_ARTICLES = 500
+
+
+def parse_articles(params: dict):
+    '''Список артикулов из ?articles=a,b,c без повторов, с сохранением порядка'''
+    if not params.get('articles'):
+        return None
+    articles = list(dict.fromkeys(a.strip() for a in params['articles'].split(',') if a.strip()))
+    if len(articles) > MAX_BATCH_ARTICLES:
+        raise ValueError(f'Не больше {MAX_BATCH_ARTICLES} артикулов за запрос')
+    return articles
+
+
+def get_header(event: dict, name: str):
+    '''Регистронезависимое чтение заголовка запроса'''
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def make_etag(seed: str) -> str:
+    '''Строгий ETag по версии каталога и артикулу (или по телу ответа)'''
+    return '"' + hashlib.sha1(seed.encode('utf-8')).hexdigest()[:20] + '"'
+
+
+def etag_matches(event: dict, etag: str) -> bool:
+    '''Проверка If-None-Match (слабое сравнение, как требует RFC 9110)'''
+    if_none_match = get_header(event, 'If-None-Match')
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+def not_modified(etag: str) -> dict:
+    return {
+        'statusCode': 304,
+        'headers': {
+            'ETag': etag,
+            'Cache-Control': CACHE_CONTROL,
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'ETag'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
 
 
 def handler(event: dict, context) -> dict:
-    '''Получение изображений товара по артикулу'''
+    '''Получение изображений товара по артикулу или галерей сразу для списка (?articles=)'''
     
     method = event.get('httpMethod', 'GET')
     
@@ -14,7 +68,7 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match'
             },
             'body': '',
             'isBase64Encoded': False
@@ -32,50 +86,95 @@ def handler(event: dict, context) -> dict:
         }
     
     try:
-        article = event.get('queryStringParameters', {}).get('article')
+        params = event.get('queryStringParameters') or {}
+        article = params.get('article')
         
-        if not article:
+        try:
+            articles = parse_articles(params)
+        except ValueError as e:
             return {
                 'statusCode': 400,
                 'headers': {
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'error': 'Article parameter required'}),
+                'body': json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False),
                 'isBase64Encoded': False
             }
         
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
-        cursor = conn.cursor()
-        
-        article_escaped = article.replace("'", "''")
-        cursor.execute(f"""
-            SELECT pi.image_url, pi.sort_order
-            FROM product_images pi
-            JOIN products p ON p.id = pi.product_id
-            WHERE p.article = '{article_escaped}'
-            ORDER BY pi.sort_order ASC
-        """)
+        if not article and not articles:
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({'error': 'Article parameter required'}),
+                'isBase64Encoded': False
+            }
         
-        results = cursor.fetchall()
+        with transaction() as cursor:
+            execute_prepared(cursor, 'catalog_version', "SELECT version FROM catalog_version WHERE id = 1")
+            version_row = cursor.fetchone()
+            
+            etag = None
+            if version_row:
+                etag = make_etag(f"{version_row[0]}:{article}:{','.join(articles or [])}")
+                if etag_matches(event, etag):
+                    return not_modified(etag)
+            
+            if articles:
+                # Все галереи одним запросом вместо вызова функции на каждый товар
+                execute_prepared(cursor, 'product_images_by_articles', """
+                    SELECT p.article, array_agg(pi.image_url ORDER BY pi.sort_order)
+                    FROM product_images pi
+                    JOIN products p ON p.id = pi.product_id
+                    WHERE p.article = ANY($1::text[])
+                    GROUP BY p.article
+                """, (articles,))
+            else:
+                execute_prepared(cursor, 'product_images_by_article', """
+                    SELECT pi.image_url, pi.sort_order
+                    FROM product_images pi
+                    JOIN products p ON p.id = pi.product_id
+                    WHERE p.article = $1::text
+                    ORDER BY pi.sort_order ASC
+                """, (article,))
+            
+            results = cursor.fetchall()
         
-        cursor.close()
-        conn.close()
+        if articles:
+            # Артикулы без галереи тоже в ответе — с пустым списком
+            galleries = {a: [] for a in articles}
+            galleries.update({row[0]: row[1] for row in results})
+            body = json.dumps({
+                'success': True,
+                'images': galleries,
+                'count': len(galleries)
+            })
+        else:
+            images = [row[0] for row in results]
+            body = json.dumps({
+                'success': True,
+                'images': images,
+                'count': len(images)
+            })
         
-        images = [row[0] for row in results]
+        if etag is None:
+            etag = make_etag(body)
+            if etag_matches(event, etag):
+                return not_modified(etag)
         
         return {
             'statusCode': 200,
             'headers': {
                 'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
+                'ETag': etag,
+                'Cache-Control': CACHE_CONTROL,
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Expose-Headers': 'ETag'
             },
-            'body': json.dumps({
-                'success': True,
-                'images': images,
-                'count': len(images)
-            }),
+            'body': body,
             'isBase64Encoded': False
         }
         
@@ -1,9 +1,364 @@
 import json
 import os
+import bisect
+import hashlib
+from datetime import datetime, timezone
 import psycopg2
+from db import transaction, execute_prepared
+from compression import negotiate_encoding, encode_response
+
+# Браузер и CDN могут отдавать ответ из кэша минуту и ещё 10 минут
+# показывать устаревший, пока в фоне идёт перепроверка по ETag
+CACHE_CONTROL = 'public, max-age=60, stale-while-revalidate=600'
+
+# Поля товара, доступные для проекции через ?fields=
+PRODUCT_FIELDS = ('id', 'article', 'name', 'category', 'dimensions', 'price', 'image', 'description', 'unit', 'renditions')
+
+# Верхняя граница размера страницы при keyset-пагинации
+MAX_PAGE_LIMIT = 1000
+
+# Поиск (?q=): сколько результатов отдавать по умолчанию и максимум
+SEARCH_DEFAULT_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# Максимум артикулов в одном пакетном запросе (?articles=)
+MAX_BATCH_ARTICLES = 500
+
+# Сколько разных поисковых запросов держать в кэше на одну версию каталога
+SEARCH_CACHE_SIZE = 500
+
+# Сколько готовых (сериализованных и сжатых) ответов держать на одну версию
+RESPONSE_CACHE_SIZE = 200
+
+# ?format=columnar: категории и единицы кодируются словарём (различных значений мало),
+# пустые картинки, описания и рендиции не передаются
+COLUMNAR_DICT_FIELDS = ('category', 'unit')
+COLUMNAR_SPARSE_FIELDS = ('image', 'description', 'renditions')
+
+# Разделитель уровней в пути категории: "Игра > Горки > h-1.0"
+CATEGORY_SEPARATOR = ' > '
+
+# Снимок каталога в памяти: переживает тёплые вызовы функции
+# и перечитывается из БД только при смене catalog_version
+_catalog_cache = {
+    'version': None,
+    'products': [],
+    'by_category': {},
+    'by_prefix': {},
+    'by_article': {},
+    'search': {},
+    'responses': {},
+    'tree': None
+}
+
+
+def row_to_product(row) -> dict:
+    return {
+        'id': row[0],
+        'article': row[1],
+        'name': row[2],
+        'category': row[3],
+        'dimensions': row[4],
+        'price': row[5],
+        'image': row[6] or '',
+        'description': row[7] or '',
+        'unit': row[8] or 'шт',
+        # Готовые уменьшенные копии картинки: thumb / card (WebP), xlsx / pdf (JPEG)
+        'renditions': row[9] or {}
+    }
+
+
+def load_catalog(cursor, schema: str) -> dict:
+    '''Возвращает снимок каталога, перечитывая товары только при смене версии'''
+    execute_prepared(cursor, 'catalog_version', f"SELECT version FROM {schema}.catalog_version WHERE id = 1")
+    row = cursor.fetchone()
+    version = row[0] if row else None
+    
+    if version is not None and version == _catalog_cache['version']:
+        return _catalog_cache
+    
+    execute_prepared(cursor, 'catalog_products', f"""
+        SELECT id, article, name, category, dimensions, price, image_url, description, unit, image_renditions
+        FROM {schema}.products
+        ORDER BY id
+    """)
+    
+    products = []
+    by_category = {}
+    by_prefix = {}
+    by_article = {}
+    for row in cursor.fetchall():
+        product = row_to_product(row)
+        products.append(product)
+        by_article[product['article']] = product
+        by_category.setdefault(product['category'], []).append(product)
+        
+        # Индекс поддеревьев: товар попадает в каждый префикс своего пути
+        parts = (product['category'] or '').split(CATEGORY_SEPARATOR)
+        for depth in range(1, len(parts) + 1):
+            prefix = CATEGORY_SEPARATOR.join(parts[:depth])
+            by_prefix.setdefault(prefix, []).append(product)
+    
+    _catalog_cache['version'] = version
+    _catalog_cache['products'] = products
+    _catalog_cache['by_category'] = by_category
+    _catalog_cache['by_prefix'] = by_prefix
+    _catalog_cache['by_article'] = by_article
+    _catalog_cache['search'] = {}
+    _catalog_cache['responses'] = {}
+    _catalog_cache['tree'] = None
+    return _catalog_cache
+
+
+def load_subcategory_images(cursor, schema: str) -> dict:
+    '''Картинки подкатегорий из upload-subcategory-image: имя в нижнем регистре → URL'''
+    try:
+        cursor.execute(f"SELECT name, image_url FROM {schema}.subcategories WHERE image_url IS NOT NULL AND image_url <> ''")
+    except psycopg2.Error as e:
+        print(f'Subcategory images unavailable: {e}')
+        cursor.connection.rollback()
+        return {}
+    return {name.strip().lower(): image_url for name, image_url in cursor.fetchall() if name}
+
+
+def get_category_tree(cursor, schema: str, catalog: dict) -> list:
+    '''Дерево категорий с количеством товаров, диапазоном цен и картинками узлов'''
+    # Строится один раз на версию каталога и дальше отдаётся из снимка
+    if catalog['tree'] is not None:
+        return catalog['tree']
+    
+    images = load_subcategory_images(cursor, schema)
+    root = {'children': {}}
+    for product in catalog['products']:
+        price = product['price'] if isinstance(product['price'], (int, float)) else None
+        node = root
+        parts = (product['category'] or '').split(CATEGORY_SEPARATOR)
+        for depth, part in enumerate(parts, start=1):
+            child = node['children'].get(part)
+            if child is None:
+                child = {
+                    'name': part,
+                    'path': CATEGORY_SEPARATOR.join(parts[:depth]),
+                    'count': 0,
+                    'min_price': None,
+                    'max_price': None,
+                    'image': images.get(part.strip().lower(), ''),
+                    'children': {}
+                }
+                node['children'][part] = child
+            child['count'] += 1
+            if price is not None:
+                child['min_price'] = price if child['min_price'] is None else min(child['min_price'], price)
+                child['max_price'] = price if child['max_price'] is None else max(child['max_price'], price)
+            node = child
+    
+    def to_list(children: dict) -> list:
+        return [dict(node, children=to_list(node['children'])) for node in children.values()]
+    
+    catalog['tree'] = to_list(root['children'])
+    return catalog['tree']
+
+
+def search_products(cursor, schema: str, query: str, limit: int) -> list:
+    '''Поиск: русская морфология по названию + триграммы по артикулу и названию'''
+    # Триграммы дают устойчивость к опечаткам («качелли гнезда») и поиск
+    # по фрагменту артикула («0115»); GIN-индексы заведены в миграции V0052
+    cache_key = (query, limit)
+    cached = _catalog_cache['search'].get(cache_key)
+    if cached is not None:
+        return cached
+    
+    like_prefix = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    # $1 — запрос, $2 — LIKE-префикс артикула, $3 — лимит
+    execute_prepared(cursor, 'search_products', f"""
+        SELECT id, article, name, category, dimensions, price, image_url, description, unit, image_renditions
+        FROM {schema}.products
+        WHERE to_tsvector('russian', name) @@ plainto_tsquery('russian', $1::text)
+           OR article % $1::text
+           OR article LIKE $2::text
+           OR $1::text <% name
+        ORDER BY
+            (article = $1::text) DESC,
+            ts_rank(to_tsvector('russian', name), plainto_tsquery('russian', $1::text)) * 2
+                + similarity(article, $1::text)
+                + word_similarity($1::text, name) DESC,
+            id
+        LIMIT $3::int
+    """, (query, like_prefix, limit))
+    
+    results = [row_to_product(row) for row in cursor.fetchall()]
+    
+    if len(_catalog_cache['search']) >= SEARCH_CACHE_SIZE:
+        _catalog_cache['search'].clear()
+    _catalog_cache['search'][cache_key] = results
+    return results
+
+
+def load_galleries(cursor, schema: str, articles: list) -> dict:
+    '''Галереи (product_images) для страницы ответа одним запросом: артикул → URL по sort_order'''
+    if not articles:
+        return {}
+    execute_prepared(cursor, 'galleries_by_articles', f"""
+        SELECT p.article, array_agg(pi.image_url ORDER BY pi.sort_order)
+        FROM {schema}.product_images pi
+        JOIN {schema}.products p ON p.id = pi.product_id
+        WHERE p.article = ANY($1::text[])
+        GROUP BY p.article
+    """, (articles,))
+    return {article: images for article, images in cursor.fetchall()}
+
+
+def parse_page_params(params: dict) -> tuple:
+    '''Разбор limit / after_id / fields; ValueError при некорректных значениях'''
+    limit = None
+    if params.get('limit'):
+        limit = int(params['limit'])
+        if limit < 1 or limit > MAX_PAGE_LIMIT:
+            raise ValueError(f'limit должен быть от 1 до {MAX_PAGE_LIMIT}')
+    
+    after_id = int(params['after_id']) if params.get('after_id') else None
+    
+    fields = None
+    if params.get('fields'):
+        fields = [f.strip() for f in params['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+        if unknown:
+            raise ValueError(f'Неизвестные поля: {", ".join(unknown)}')
+    
+    return limit, after_id, fields
+
+
+def parse_articles(params: dict):
+    '''Список артикулов из ?articles=a,b,c без повторов, с сохранением порядка'''
+    if not params.get('articles'):
+        return None
+    articles = list(dict.fromkeys(a.strip() for a in params['articles'].split(',') if a.strip()))
+    if len(articles) > MAX_BATCH_ARTICLES:
+        raise ValueError(f'Не больше {MAX_BATCH_ARTICLES} артикулов за запрос')
+    return articles
+
+
+def parse_changed_since(params: dict):
+    '''?changed_since=: номер версии каталога (int) или ISO-время (datetime с поясом, без пояса — UTC)'''
+    raw = (params.get('changed_since') or '').strip()
+    if not raw:
+        return None
+    if raw.isdigit():
+        return int(raw)
+    try:
+        moment = datetime.fromisoformat(raw)
+    except ValueError:
+        raise ValueError('changed_since должен быть версией каталога или датой ISO 8601')
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+def get_changes(cursor, schema: str, since) -> tuple:
+    '''Дельта каталога: изменённые после since товары и артикулы удалённых'''
+    # Версия надёжнее времени: номера выдаются под блокировкой строки catalog_version
+    # в порядке коммитов, а часы клиента и сервера могут расходиться
+    if isinstance(since, int):
+        mode, changed_column, deleted_column, cast = 'version', 'changed_version', 'deleted_version', 'bigint'
+    else:
+        # updated_at/deleted_at — TIMESTAMP из CURRENT_TIMESTAMP в поясе сессии: момент
+        # переводится в тот же пояс на стороне параметра, индекс по колонке остаётся в деле
+        mode, changed_column, deleted_column, cast = 'time', 'updated_at', 'deleted_at', 'timestamptz::timestamp'
+    
+    execute_prepared(cursor, f'changed_products_by_{mode}', f"""
+        SELECT id, article, name, category, dimensions, price, image_url, description, unit, image_renditions
+        FROM {schema}.products
+        WHERE {changed_column} > $1::{cast}
+        ORDER BY id
+    """, (since,))
+    changed = [row_to_product(row) for row in cursor.fetchall()]
+    
+    # Артикул, удалённый и снова загруженный, приходит только среди изменённых
+    execute_prepared(cursor, f'deleted_products_by_{mode}', f"""
+        SELECT t.article
+        FROM {schema}.product_tombstones t
+        WHERE t.{deleted_column} > $1::{cast}
+          AND NOT EXISTS (SELECT 1 FROM {schema}.products p WHERE p.article = t.article)
+        ORDER BY t.article
+    """, (since,))
+    deleted = [row[0] for row in cursor.fetchall()]
+    
+    return changed, deleted
+
+
+def to_columnar(products: list, fields=None) -> dict:
+    '''Колоночный формат: массив на поле, словари для category/unit, разреженные image/description'''
+    # Контракт декодера на фронтенде — src/utils/catalogColumnar.ts
+    columns = {}
+    dictionaries = {}
+    for field in fields or PRODUCT_FIELDS:
+        values = [p[field] for p in products]
+        if field in COLUMNAR_DICT_FIELDS:
+            index = {}
+            columns[field] = [index.setdefault(value, len(index)) for value in values]
+            dictionaries[field] = list(index)
+        elif field in COLUMNAR_SPARSE_FIELDS:
+            rows = [i for i, value in enumerate(values) if value]
+            columns[field] = {'rows': rows, 'values': [values[i] for i in rows]}
+        else:
+            columns[field] = values
+    return {'columns': columns, 'dictionaries': dictionaries}
+
+
+def paginate(products: list, limit, after_id) -> tuple:
+    '''Keyset-пагинация по id: список в снимке уже упорядочен по id'''
+    start = 0
+    if after_id is not None:
+        start = bisect.bisect_right(products, after_id, key=lambda p: p['id'])
+    
+    if limit is None:
+        return products[start:], None
+    
+    page = products[start:start + limit]
+    next_after_id = page[-1]['id'] if start + limit < len(products) else None
+    return page, next_after_id
+
+
+def get_header(event: dict, name: str):
+    '''Регистронезависимое чтение заголовка запроса'''
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def make_etag(seed: str) -> str:
+    '''Строгий ETag по версии каталога и параметрам запроса (или по телу ответа)'''
+    return '"' + hashlib.sha1(seed.encode('utf-8')).hexdigest()[:20] + '"'
+
+
+def etag_matches(event: dict, etag: str) -> bool:
+    '''Проверка If-None-Match (слабое сравнение, как требует RFC 9110)'''
+    if_none_match = get_header(event, 'If-None-Match')
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+def not_modified(etag: str) -> dict:
+    return {
+        'statusCode': 304,
+        'headers': {
+            'ETag': etag,
+            'Cache-Control': CACHE_CONTROL,
+            'Vary': 'Accept-Encoding',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'ETag'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
 
 def handler(event: dict, context) -> dict:
-    '''API для получения списка товаров с фильтрацией по категории'''
+    '''API каталога: товары с фильтрами, поиск, дерево категорий (?view=tree), дельта (?changed_since=) и галереи (?include=gallery)'''
     
     method = event.get('httpMethod', 'GET')
     
@@ -13,7 +368,7 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match'
             },
             'body': '',
             'isBase64Encoded': False
@@ -22,60 +377,156 @@ def handler(event: dict, context) -> dict:
     try:
         params = event.get('queryStringParameters') or {}
         category = params.get('category')
+        category_prefix = params.get('category_prefix')
+        query = (params.get('q') or '').strip()
+        view = params.get('view')
+        encoding = negotiate_encoding(event)
         
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
-        cursor = conn.cursor()
+        try:
+            limit, after_id, fields = parse_page_params(params)
+            articles = parse_articles(params)
+            changed_since = parse_changed_since(params)
+            columnar = params.get('format') == 'columnar'
+            with_gallery = params.get('include') == 'gallery'
+            if params.get('format') not in (None, '', 'objects', 'columnar'):
+                raise ValueError('format должен быть objects или columnar')
+            # Ключ ответа только из распознанных и нормализованных параметров:
+            # посторонние параметры (utm_*, антикэш) не плодят записи в кэше и ETag
+            if view == 'tree':
+                request_key = {'view': 'tree'}
+            else:
+                request_key = {
+                    'changed_since': (params.get('changed_since') or '').strip() or None,
+                    'articles': articles,
+                    'q': query or None,
+                    'category': category or None,
+                    'category_prefix': (category_prefix or '').strip() or None,
+                    'limit': limit,
+                    'after_id': after_id,
+                    'fields': fields,
+                    'columnar': columnar,
+                    'gallery': with_gallery
+                }
+                request_key = {k: v for k, v in request_key.items() if v not in (None, False)}
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
         
         schema = os.environ.get('MAIN_DB_SCHEMA', 't_p92226548_baby_playground_equi')
         
-        if category:
-            # Escape single quotes for Simple Query Protocol
-            safe_category = category.replace("'", "''")
-            cursor.execute(f"""
-                SELECT id, article, name, category, dimensions, price, image_url, description, unit
-                FROM {schema}.products
-                WHERE category = '{safe_category}'
-                ORDER BY id
-            """)
+        with transaction() as cursor:
+            catalog = load_catalog(cursor, schema)
+            
+            # При известной версии ETag считается без сериализации ответа;
+            # у каждой кодировки (br/gzip/без сжатия) свой ETag
+            etag = None
+            if catalog['version'] is not None:
+                etag = make_etag(f"{catalog['version']}:{encoding}:{json.dumps(request_key, sort_keys=True, ensure_ascii=False)}")
+                if etag_matches(event, etag):
+                    return not_modified(etag)
+                
+                cached = catalog['responses'].get(etag)
+                if cached:
+                    return dict(cached, headers=dict(cached['headers']))
+            
+            if view == 'tree':
+                tree = get_category_tree(cursor, schema, catalog)
+            elif changed_since is not None:
+                # Дельта для клиентов, у которых каталог уже есть: только изменения и удаления
+                products, deleted = get_changes(cursor, schema, changed_since)
+            elif articles is not None:
+                # Пакетная выборка для корзины, избранного и КП: порядок как в запросе
+                products = [catalog['by_article'][a] for a in articles if a in catalog['by_article']]
+            elif query:
+                # Поиск ранжирует результаты, поэтому keyset-пагинация к нему не применяется
+                search_limit = min(limit or SEARCH_DEFAULT_LIMIT, MAX_SEARCH_LIMIT)
+                products = search_products(cursor, schema, query, search_limit) if len(query) >= 2 else []
+            elif category:
+                products = catalog['by_category'].get(category, [])
+            elif category_prefix:
+                # Всё поддерево: "Игра" отдаёт и "Игра > Горки > h-1.0", но не "Игровые ..."
+                products = catalog['by_prefix'].get(category_prefix.strip(), [])
+            else:
+                products = catalog['products']
+            
+            if view != 'tree':
+                next_after_id = None
+                if not query and articles is None and changed_since is None:
+                    products, next_after_id = paginate(products, limit, after_id)
+                
+                # Галереи только для отдаваемой страницы, а не для всего каталога
+                galleries = load_galleries(cursor, schema, [p['article'] for p in products]) if with_gallery else None
+        
+        if view == 'tree':
+            response = {
+                'success': True,
+                'tree': tree,
+                'count': len(catalog['products'])
+            }
         else:
-            cursor.execute(f"""
-                SELECT id, article, name, category, dimensions, price, image_url, description, unit
-                FROM {schema}.products
-                ORDER BY id
-            """)
+            response = {
+                'success': True,
+                'count': len(products),
+                'version': catalog['version']
+            }
+            if columnar:
+                response['format'] = 'columnar'
+                response.update(to_columnar(products, fields))
+            elif fields:
+                response['products'] = [{f: p[f] for f in fields} for p in products]
+            else:
+                response['products'] = products
+            if galleries is not None:
+                response['galleries'] = galleries
+            if changed_since is not None:
+                response['deleted'] = deleted
+                response['changed_since'] = params['changed_since'].strip()
+            elif articles is not None:
+                response['missing'] = [a for a in articles if a not in catalog['by_article']]
+            elif query:
+                response['query'] = query
+            elif limit is not None:
+                response['next_after_id'] = next_after_id
         
-        products = []
-        for row in cursor.fetchall():
-            products.append({
-                'id': row[0],
-                'article': row[1],
-                'name': row[2],
-                'category': row[3],
-                'dimensions': row[4],
-                'price': row[5],
-                'image': row[6] or '',
-                'description': row[7] or '',
-                'unit': row[8] or 'шт'
-            })
+        if columnar:
+            # Компактный вывод: без пробелов и с кириллицей как есть, а не \uXXXX
+            body = json.dumps(response, ensure_ascii=False, separators=(',', ':'))
+        else:
+            body = json.dumps(response)
         
-        cursor.close()
-        conn.close()
+        cacheable = etag is not None
+        if etag is None:
+            etag = make_etag(f'{encoding}:{body}')
+            if etag_matches(event, etag):
+                return not_modified(etag)
         
-        return {
+        result = encode_response({
             'statusCode': 200,
             'headers': {
                 'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
+                'ETag': etag,
+                'Cache-Control': CACHE_CONTROL,
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Expose-Headers': 'ETag'
             },
-            'body': json.dumps({
-                'success': True,
-                'products': products,
-                'count': len(products)
-            }),
+            'body': body,
             'isBase64Encoded': False
-        }
+        }, encoding)
         
+        # Сжатое тело кладём рядом со снимком, чтобы не сжимать его на каждом запросе
+        if cacheable:
+            if len(catalog['responses']) >= RESPONSE_CACHE_SIZE:
+                catalog['responses'].clear()
+            catalog['responses'][etag] = result
+        return dict(result, headers=dict(result['headers']))
+    
     except Exception as e:
         return {
             'statusCode': 500,
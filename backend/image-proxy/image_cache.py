@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Сколько секунд ответ считается свежим; после этого — условный запрос к источнику
+CACHE_TTL_SECONDS = 600
+
+# Бюджет памяти экземпляра функции под картинки (LRU вытесняет самые давние)
+MEMORY_BUDGET_BYTES = 32 * 1024 * 1024
+
+# Дисковый уровень в /tmp переживает пересоздание модуля, но не экземпляра
+DISK_DIR = '/tmp/image-proxy-cache'
+DISK_BUDGET_BYTES = 256 * 1024 * 1024
+
+# Картинки крупнее этого в память не кладём, только на диск
+MAX_MEMORY_ENTRY_BYTES = 4 * 1024 * 1024
+
+_memory = OrderedDict()
+_memory_bytes = 0
+_lock = threading.Lock()
+
+
+def cache_key(url: str) -> str:
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def is_fresh(entry: dict) -> bool:
+    return time.time() - entry['fetched_at'] < CACHE_TTL_SECONDS
+
+
+def _remember(key: str, entry: dict):
+    '''Кладёт запись в память с учётом бюджета; вызывается под _lock'''
+    global _memory_bytes
+    if key in _memory:
+        _memory_bytes -= len(_memory.pop(key)['data'])
+    if len(entry['data']) > MAX_MEMORY_ENTRY_BYTES:
+        return
+    _memory[key] = entry
+    _memory_bytes += len(entry['data'])
+    while _memory_bytes > MEMORY_BUDGET_BYTES and _memory:
+        _, evicted = _memory.popitem(last=False)
+        _memory_bytes -= len(evicted['data'])
+
+
+def _disk_paths(key: str) -> tuple:
+    return os.path.join(DISK_DIR, f'{key}.bin'), os.path.join(DISK_DIR, f'{key}.json')
+
+
+def _read_disk(key: str):
+    data_path, meta_path = _disk_paths(key)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(data_path, 'rb') as f:
+            data = f.read()
+    except (OSError, ValueError):
+        return None
+    if len(data) != meta.get('size'):
+        return None
+    return dict(meta, data=data)
+
+
+def _atomic_write(path: str, content: bytes):
+    '''Запись через временный файл и os.replace: читатель не увидит файл наполовину'''
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _write_disk(key: str, entry: dict, with_data: bool = True):
+    os.makedirs(DISK_DIR, exist_ok=True)
+    data_path, meta_path = _disk_paths(key)
+    meta = {k: v for k, v in entry.items() if k != 'data'}
+    meta['size'] = len(entry['data'])
+    if with_data:
+        _atomic_write(data_path, entry['data'])
+    _atomic_write(meta_path, json.dumps(meta).encode('utf-8'))
+
+
+def _trim_disk():
+    '''Удаляет самые давно использованные файлы, пока кэш не уложится в бюджет'''
+    try:
+        files = [os.path.join(DISK_DIR, name) for name in os.listdir(DISK_DIR)]
+        stats = [(path, os.stat(path)) for path in files]
+    except OSError:
+        return
+    total = sum(st.st_size for _, st in stats)
+    if total <= DISK_BUDGET_BYTES:
+        return
+    for path, st in sorted(stats, key=lambda item: item[1].st_mtime):
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= st.st_size
+        if total <= DISK_BUDGET_BYTES:
+            break
+
+
+def get(url: str):
+    '''Запись кэша по URL: сначала память, затем диск (с подъёмом в память); None, если нет'''
+    key = cache_key(url)
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None:
+            _memory.move_to_end(key)
+            return entry
+    
+    entry = _read_disk(key)
+    if entry is None:
+        return None
+    try:
+        # mtime — метка последнего использования для вытеснения с диска
+        os.utime(_disk_paths(key)[0])
+    except OSError:
+        pass
+    with _lock:
+        _remember(key, entry)
+    return entry
+
+
+def put(url: str, data: bytes, content_type: str, etag=None, last_modified=None) -> dict:
+    '''Сохраняет ответ источника в оба уровня и возвращает запись'''
+    entry = {
+        'data': data,
+        'content_type': content_type,
+        'etag': etag,
+        'last_modified': last_modified,
+        'fetched_at': time.time()
+    }
+    key = cache_key(url)
+    with _lock:
+        _remember(key, entry)
+    try:
+        _write_disk(key, entry)
+        _trim_disk()
+    except OSError as e:
+        print(f'Image cache disk write failed: {e}')
+    return entry
+
+
+def refresh(url: str, entry: dict) -> dict:
+    '''Источник ответил 304: продлеваем свежесть, переписывая только метаданные'''
+    entry = dict(entry, fetched_at=time.time())
+    key = cache_key(url)
+    with _lock:
+        _remember(key, entry)
+    try:
+        _write_disk(key, entry, with_data=False)
+    except OSError as e:
+        print(f'Image cache disk write failed: {e}')
+    return entry
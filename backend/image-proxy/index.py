@@ -1,10 +1,292 @@
 import json
-import urllib.request
+import time
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait
 import base64
+import hashlib
+import image_cache
+import renditions
+import upstream
+
+# Больше этого из источника не читаем: защита памяти экземпляра
+MAX_UPSTREAM_BYTES = 20 * 1024 * 1024
+
+# Предел тела одного ответа в режиме raw (лимит ответа облачной функции);
+# картинку больше можно забрать частями через Range
+MAX_RAW_RESPONSE_BYTES = 3 * 1024 * 1024
+
+# Пакетный режим (POST {"urls": [...]}): сколько URL за раз, сколько качать
+# параллельно, общий дедлайн и предел суммарного объёма картинок в ответе
+MAX_BATCH_URLS = 50
+BATCH_WORKERS = 8
+BATCH_DEADLINE_SECONDS = 20
+MAX_BATCH_RESPONSE_BYTES = 2 * 1024 * 1024
+
+# Режим raw отдаёт сами байты — браузер кэширует их как обычную картинку
+RAW_CACHE_CONTROL = 'public, max-age=86400'
+
+# SVG — тоже image/*, но может содержать скрипты и исполнится на домене функции
+UNSAFE_IMAGE_TYPES = ('image/svg+xml',)
+
+
+def quote_url(url: str) -> str:
+    '''Кодирует кириллицу и пробелы в пути URL (имена файлов на CDN бывают русскими)'''
+    parsed_url = urllib.parse.urlparse(url)
+    encoded_path = urllib.parse.quote(parsed_url.path.encode('utf-8'), safe='/:%')
+    return urllib.parse.urlunparse((
+        parsed_url.scheme,
+        parsed_url.netloc,
+        encoded_path,
+        parsed_url.params,
+        parsed_url.query,
+        parsed_url.fragment
+    ))
+
+
+def is_image_type(content_type) -> bool:
+    '''Растровая картинка по Content-Type источника (параметры вроде charset игнорируются)'''
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    return media_type.startswith('image/') and media_type not in UNSAFE_IMAGE_TYPES
+
+
+def _fetch_upstream(url: str) -> tuple:
+    # Запись могла обновиться, пока ждали своей очереди
+    entry = image_cache.get(url)
+    if entry is not None and image_cache.is_fresh(entry):
+        return entry, 'HIT'
+    
+    # Устаревшую запись перепроверяем условным запросом: при 304 байты не качаются
+    headers = {}
+    if entry is not None:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    
+    try:
+        status, response_headers, data = upstream.fetch(quote_url(url), headers, MAX_UPSTREAM_BYTES)
+    except upstream.UpstreamHTTPError:
+        raise
+    except Exception as e:
+        # Источник недоступен — лучше отдать устаревшую картинку, чем ошибку
+        if entry is not None:
+            print(f'Upstream failed, serving stale copy of {url}: {e}')
+            return entry, 'STALE'
+        raise
+    
+    if status == 304 and entry is not None:
+        return image_cache.refresh(url, entry), 'REVALIDATED'
+    # Не картинку (HTML, скрипты) не кэшируем и не отдаём: иначе функция раздаёт чужой контент со своего домена
+    content_type = response_headers.get('Content-Type')
+    if not is_image_type(content_type):
+        raise upstream.UnsupportedMediaType(content_type)
+    return image_cache.put(
+        url,
+        data,
+        content_type,
+        response_headers.get('ETag'),
+        response_headers.get('Last-Modified')
+    ), 'MISS'
+
+
+def fetch_image(url: str) -> tuple:
+    '''Картинка из кэша или источника: (запись кэша, HIT / REVALIDATED / MISS / STALE)'''
+    entry = image_cache.get(url)
+    if entry is not None and image_cache.is_fresh(entry):
+        return entry, 'HIT'
+    # Параллельные запросы одного URL делят одну загрузку из источника
+    return upstream.single_flight(url, lambda: _fetch_upstream(url))
+
+
+def get_rendition(url: str, source: dict, spec: dict) -> dict:
+    '''Уменьшенная/перекодированная копия из кэша или Pillow; ключ включает версию источника'''
+    # Источник сменился — ключ тоже, поэтому рендиции не нужно перепроверять
+    source_tag = source.get('etag') or hashlib.sha1(source['data']).hexdigest()
+    key = f'{url}#{source_tag}#{renditions.spec_key(spec)}'
+    entry = image_cache.get(key)
+    if entry is not None:
+        return entry
+    
+    def generate():
+        cached = image_cache.get(key)
+        if cached is not None:
+            return cached
+        data, content_type = renditions.render(source['data'], spec)
+        etag = '"' + image_cache.cache_key(key)[:20] + '"'
+        return image_cache.put(key, data, content_type, etag=etag)
+    
+    # Одну и ту же миниатюру одновременно генерирует только один поток
+    return upstream.single_flight(key, generate)
+
+
+def load_image(url: str, spec) -> tuple:
+    '''Исходная картинка или её рендиция: (запись кэша, статус кэша)'''
+    entry, cache_status = fetch_image(url)
+    # Проверка и для записей, попавших в кэш раньше, — до Pillow и до отдачи байтов
+    if not is_image_type(entry['content_type']):
+        raise upstream.UnsupportedMediaType(entry['content_type'])
+    if spec is not None:
+        # Карточкам каталога нужны миниатюры, а не исходные PNG на сотни КБ
+        entry = get_rendition(url, entry, spec)
+    return entry, cache_status
+
+
+# Пул переживает тёплые вызовы; загрузки, не успевшие к дедлайну, доработают
+# в фоне и попадут в кэш для следующего запроса
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+
+
+def batch_response(body: dict, accept: str) -> dict:
+    '''Несколько картинок за один вызов: параллельно, с общим дедлайном и ошибками по каждому URL'''
+    if not isinstance(body, dict):
+        raise ValueError('Тело запроса должно быть JSON-объектом {"urls": [...]}')
+    urls = body.get('urls')
+    if not isinstance(urls, list) or not urls or not all(isinstance(u, str) and u for u in urls):
+        raise ValueError('urls должен быть непустым списком строк')
+    if len(urls) > MAX_BATCH_URLS:
+        raise ValueError(f'Не больше {MAX_BATCH_URLS} URL за запрос')
+    spec = renditions.parse_spec(body, accept)
+    
+    deadline = time.monotonic() + BATCH_DEADLINE_SECONDS
+    unique_urls = list(dict.fromkeys(urls))
+    futures = {url: _batch_executor.submit(load_image, url, spec) for url in unique_urls}
+    wait(futures.values(), timeout=max(deadline - time.monotonic(), 0))
+    
+    results = []
+    total_bytes = 0
+    for url in urls:
+        future = futures[url]
+        if not future.done():
+            results.append({'url': url, 'success': False, 'error': 'Не уложились в дедлайн пакета'})
+            continue
+        try:
+            entry, cache_status = future.result()
+        except Exception as e:
+            results.append({'url': url, 'success': False, 'error': str(e)})
+            continue
+        
+        total_bytes += len(entry['data'])
+        if total_bytes > MAX_BATCH_RESPONSE_BYTES:
+            results.append({'url': url, 'success': False, 'error': 'Превышен объём пакета, запросите картинку отдельно'})
+            continue
+        results.append({
+            'url': url,
+            'success': True,
+            'data': base64.b64encode(entry['data']).decode('utf-8'),
+            'contentType': entry['content_type'],
+            'cache': cache_status
+        })
+    
+    return {
+        'success': True,
+        'results': results,
+        'count': len(results),
+        'failed': sum(1 for r in results if not r['success'])
+    }
+
+
+def get_header(event: dict, name: str):
+    '''Регистронезависимое чтение заголовка запроса'''
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def etag_matches(event: dict, etag: str) -> bool:
+    '''Проверка If-None-Match (слабое сравнение, как требует RFC 9110)'''
+    if_none_match = get_header(event, 'If-None-Match')
+    if not if_none_match:
+        return False
+    # ETag источника бывает слабым (W/"..."), а браузер может прислать любой из вариантов
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return '*' in candidates or opaque in candidates or f'W/{opaque}' in candidates
+
+
+def parse_range(header: str, size: int):
+    '''Один диапазон из "Range: bytes=a-b" → (start, end) включительно; ValueError, если вне файла'''
+    unit, _, spec = (header or '').partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        # Несколько диапазонов не поддерживаем — отдаём файл целиком
+        return None
+    start_text, _, end_text = spec.strip().partition('-')
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # "bytes=-500" — последние 500 байт
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError('Range Not Satisfiable')
+    return start, min(end, size - 1)
+
+
+def raw_response(event: dict, entry: dict, cache_status: str) -> dict:
+    '''Картинка как есть (без JSON-обёртки) с поддержкой If-None-Match и Range'''
+    data = entry['data']
+    # Без ETag источника считаем свой по содержимому
+    etag = entry.get('etag') or '"' + hashlib.sha1(data).hexdigest()[:20] + '"'
+    headers = {
+        'Content-Type': entry['content_type'],
+        'Cache-Control': RAW_CACHE_CONTROL,
+        'ETag': etag,
+        'Accept-Ranges': 'bytes',
+        # Браузер не должен угадывать тип по содержимому и исполнять его как HTML
+        'X-Content-Type-Options': 'nosniff',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag, Content-Range, Accept-Ranges',
+        'X-Cache': cache_status
+    }
+    
+    if etag_matches(event, etag):
+        return {'statusCode': 304, 'headers': headers, 'body': '', 'isBase64Encoded': False}
+    
+    status = 200
+    range_header = get_header(event, 'Range')
+    if range_header:
+        try:
+            byte_range = parse_range(range_header, len(data))
+        except ValueError:
+            headers['Content-Range'] = f'bytes */{len(data)}'
+            return {'statusCode': 416, 'headers': headers, 'body': '', 'isBase64Encoded': False}
+        if byte_range:
+            start, end = byte_range
+            headers['Content-Range'] = f'bytes {start}-{end}/{len(data)}'
+            data = data[start:end + 1]
+            status = 206
+    
+    if len(data) > MAX_RAW_RESPONSE_BYTES:
+        return {
+            'statusCode': 413,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Accept-Ranges': 'bytes',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'success': False,
+                'error': f'Ответ больше {MAX_RAW_RESPONSE_BYTES} байт, запросите картинку частями через Range',
+                'size': len(entry['data'])
+            }, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    return {
+        'statusCode': status,
+        'headers': headers,
+        'body': base64.b64encode(data).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
 
 def handler(event: dict, context) -> dict:
-    '''Прокси для загрузки изображений с обходом CORS'''
+    '''Прокси для загрузки изображений с обходом CORS; ?raw=1 отдаёт саму картинку для <img>, w/h/fit/format/q — миниатюру, POST — пакет URL'''
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -12,12 +294,30 @@ def handler(event: dict, context) -> dict:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, Range, If-None-Match'
             },
             'body': ''
         }
     
+    if method == 'POST':
+        try:
+            result = batch_response(json.loads(event.get('body') or '{}'), get_header(event, 'Accept'))
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)}, ensure_ascii=False)
+            }
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps(result, ensure_ascii=False)
+        }
+    
     if method != 'GET':
         return {
             'statusCode': 405,
@@ -25,8 +325,18 @@ def handler(event: dict, context) -> dict:
             'body': json.dumps({'error': 'Method not allowed'})
         }
     
-    params = event.get('queryStringParameters', {})
+    params = event.get('queryStringParameters') or {}
     url = params.get('url')
+    raw = params.get('raw') in ('1', 'true')
+    
+    try:
+        spec = renditions.parse_spec(params, get_header(event, 'Accept'))
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}, ensure_ascii=False)
+        }
     
     if not url:
         return {
@@ -36,36 +346,47 @@ def handler(event: dict, context) -> dict:
         }
     
     try:
-        parsed_url = urllib.parse.urlparse(url)
-        encoded_path = urllib.parse.quote(parsed_url.path.encode('utf-8'), safe='/:%')
-        safe_url = urllib.parse.urlunparse((
-            parsed_url.scheme,
-            parsed_url.netloc,
-            encoded_path,
-            parsed_url.params,
-            parsed_url.query,
-            parsed_url.fragment
-        ))
+        entry, cache_status = load_image(url, spec)
+        
+        if raw:
+            response = raw_response(event, entry, cache_status)
+            if spec is not None and spec['negotiated']:
+                response['headers']['Vary'] = 'Accept'
+            return response
+        
+        image_base64 = base64.b64encode(entry['data']).decode('utf-8')
         
-        with urllib.request.urlopen(safe_url) as response:
-            image_data = response.read()
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            
         return {
             'statusCode': 200,
             'headers': {
                 'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
+                'Access-Control-Allow-Origin': '*',
+                'X-Cache': cache_status
             },
             'body': json.dumps({
                 'success': True,
                 'data': image_base64,
-                'contentType': response.headers.get('Content-Type', 'image/png')
+                'contentType': entry['content_type']
             })
         }
-    except urllib.error.HTTPError as e:
+    except upstream.UnsupportedMediaType as e:
         return {
-            'statusCode': 200,
+            'statusCode': 415 if raw else 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'X-Content-Type-Options': 'nosniff',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'success': False,
+                'error': str(e),
+                'url': url
+            }, ensure_ascii=False)
+        }
+    except upstream.UpstreamHTTPError as e:
+        return {
+            # В режиме raw ошибку должен увидеть <img>, поэтому статус не 200
+            'statusCode': (e.code if 400 <= e.code < 500 else 502) if raw else 200,
             'headers': {
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
@@ -78,7 +399,7 @@ def handler(event: dict, context) -> dict:
         }
     except Exception as e:
         return {
-            'statusCode': 200,
+            'statusCode': 502 if raw else 200,
             'headers': {
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
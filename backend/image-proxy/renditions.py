@@ -0,0 +1,125 @@
+import io
+from PIL import Image, ImageOps, features
+
+# Пределы размеров, чтобы запрос не заставил функцию раздувать картинку
+MAX_DIMENSION = 2400
+
+DEFAULT_QUALITY = 80
+
+FITS = ('contain', 'cover')
+
+# Формат ответа → (формат Pillow, Content-Type)
+FORMATS = {
+    'avif': ('AVIF', 'image/avif'),
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+
+AVIF_SUPPORTED = features.check('avif')
+
+
+def _int_param(params: dict, name: str, low: int, high: int):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    # bool — подкласс int, но true/false в теле пакета — ошибка клиента
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise ValueError(f'{name} должен быть целым числом')
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} должен быть целым числом')
+    if value < low or value > high:
+        raise ValueError(f'{name} должен быть от {low} до {high}')
+    return value
+
+
+def negotiate_format(requested, accept: str):
+    '''Явный format или лучший из Accept: AVIF, затем WebP; None — оставить формат источника'''
+    if requested and requested != 'auto':
+        if requested not in FORMATS:
+            raise ValueError(f'format должен быть одним из: auto, {", ".join(FORMATS)}')
+        if requested == 'avif' and not AVIF_SUPPORTED:
+            return 'webp'
+        return requested
+    accept = (accept or '').lower()
+    if AVIF_SUPPORTED and 'image/avif' in accept:
+        return 'avif'
+    if 'image/webp' in accept:
+        return 'webp'
+    return None
+
+
+def parse_spec(params: dict, accept: str):
+    '''Параметры рендиции из w / h / fit / format / q; None, если картинку не нужно трогать'''
+    width = _int_param(params, 'w', 1, MAX_DIMENSION)
+    height = _int_param(params, 'h', 1, MAX_DIMENSION)
+    quality = _int_param(params, 'q', 1, 100) or DEFAULT_QUALITY
+    # В пакетном режиме параметры приходят из JSON и могут быть списками или объектами
+    for name in ('fit', 'format'):
+        if params.get(name) is not None and not isinstance(params[name], str):
+            raise ValueError(f'{name} должен быть строкой')
+    
+    fit = params.get('fit') or 'contain'
+    if fit not in FITS:
+        raise ValueError(f'fit должен быть одним из: {", ".join(FITS)}')
+    
+    requested = params.get('format')
+    if width is None and height is None and not requested:
+        return None
+    
+    return {
+        'w': width,
+        'h': height,
+        'fit': fit,
+        'format': negotiate_format(requested, accept),
+        'q': quality,
+        # Vary: Accept нужен, только если формат выбран по заголовку
+        'negotiated': not requested or requested == 'auto'
+    }
+
+
+def spec_key(spec: dict) -> str:
+    return f"w={spec['w']}&h={spec['h']}&fit={spec['fit']}&format={spec['format']}&q={spec['q']}"
+
+
+def render(data: bytes, spec: dict) -> tuple:
+    '''Уменьшает и перекодирует картинку Pillow: (байты, Content-Type)'''
+    image = Image.open(io.BytesIO(data))
+    source_format = image.format
+    image = ImageOps.exif_transpose(image)
+    
+    width, height = spec['w'], spec['h']
+    if width or height:
+        # Только уменьшаем: увеличение лишь раздувает ответ
+        width = min(width or image.width, image.width)
+        height = min(height or image.height, image.height)
+        if spec['fit'] == 'cover' and spec['w'] and spec['h']:
+            image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+        else:
+            image.thumbnail((width, height), Image.Resampling.LANCZOS)
+    
+    target = spec['format'] or ('jpeg' if source_format == 'JPEG' else 'png')
+    pil_format, content_type = FORMATS[target]
+    
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        # У JPEG нет прозрачности: подкладываем белый фон, как на карточках каталога
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    elif image.mode == 'P':
+        image = image.convert('RGBA')
+    
+    save_args = {'quality': spec['q']}
+    if pil_format == 'WEBP':
+        save_args['method'] = 4
+    elif pil_format == 'JPEG':
+        save_args.update(optimize=True, progressive=True)
+    elif pil_format == 'PNG':
+        save_args = {'optimize': True}
+    
+    output = io.BytesIO()
+    image.save(output, pil_format, **save_args)
+    return output.getvalue(), content_type
@@ -0,0 +1,97 @@
+import threading
+import urllib3
+
+# Явные таймауты: подключение, чтение одного блока и общий предел запроса
+CONNECT_TIMEOUT_SECONDS = 3
+READ_TIMEOUT_SECONDS = 10
+TOTAL_TIMEOUT_SECONDS = 15
+
+# Keep-alive соединения на хост переиспользуются тёплыми вызовами функции
+POOL_HOSTS = 10
+POOL_CONNECTIONS_PER_HOST = 8
+
+_http = urllib3.PoolManager(
+    num_pools=POOL_HOSTS,
+    maxsize=POOL_CONNECTIONS_PER_HOST,
+    block=False,
+    timeout=urllib3.Timeout(connect=CONNECT_TIMEOUT_SECONDS, read=READ_TIMEOUT_SECONDS, total=TOTAL_TIMEOUT_SECONDS),
+    # Повторов нет (таймауты и так ограничивают ожидание), но редиректы CDN проходим
+    retries=urllib3.Retry(total=3, connect=0, read=0, status=0, other=0, redirect=3)
+)
+
+
+class UpstreamHTTPError(Exception):
+    '''Источник ответил кодом 4xx/5xx'''
+    
+    def __init__(self, code: int, reason: str):
+        super().__init__(f'HTTP {code}: {reason}')
+        self.code = code
+        self.reason = reason
+
+
+class UnsupportedMediaType(Exception):
+    '''Источник отдал не растровую картинку (HTML, SVG, JSON...): такое тело не проксируем'''
+    
+    def __init__(self, content_type):
+        super().__init__(f'Неподдерживаемый тип содержимого: {content_type or "не указан"}')
+        self.content_type = content_type
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def single_flight(key: str, fn):
+    '''Одновременные вызовы с одним ключом ждут результат первого вместо повторной работы'''
+    with _inflight_lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _Call()
+            _inflight[key] = call
+    
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+    
+    try:
+        call.result = fn()
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        call.done.set()
+
+
+def fetch(url: str, headers: dict, max_bytes: int) -> tuple:
+    '''GET через пул соединений: (статус, заголовки, тело); 304 возвращается как есть'''
+    response = _http.request('GET', url, headers=headers, preload_content=False, redirect=True)
+    try:
+        if response.status == 304:
+            return response.status, response.headers, b''
+        if response.status >= 400:
+            raise UpstreamHTTPError(response.status, response.reason)
+        data = response.read(max_bytes + 1)
+        if len(data) > max_bytes:
+            # Дочитывать остаток слишком большого тела ради соединения дороже, чем открыть новое
+            response.close()
+            raise ValueError(f'Изображение больше {max_bytes} байт')
+        return response.status, response.headers, data
+    finally:
+        # Недочитанное соединение не вернётся в пул, поэтому дочитываем короткие
+        # тела ошибок; закрытое соединение пул заменит новым
+        if not response.closed:
+            response.drain_conn()
+        response.release_conn()
@@ -1,6 +1,8 @@
 import json
 import os
-import psycopg2
+from psycopg2.extras import execute_values
+from db import transaction, execute_prepared, bump_catalog_version
+from catalog_publisher import publish_catalog_safely
 
 
 def upload_images_handler(body: dict) -> dict:
@@ -19,53 +21,43 @@ def upload_images_handler(body: dict) -> dict:
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
-    cursor = conn.cursor()
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
     
-    # Находим товар по артикулу
-    safe_article = article.replace("'", "''")
-    cursor.execute(f"SELECT id, name FROM {schema}.products WHERE article = '{safe_article}' LIMIT 1")
-    result = cursor.fetchone()
-    
-    if not result:
-        cursor.close()
-        conn.close()
-        return {
-            'statusCode': 404,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': f'Product with article {article} not found'}),
-            'isBase64Encoded': False
-        }
-    
-    product_id = result[0]
-    
-    # Создаем таблицу для изображений если не существует
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {schema}.product_images (
-            id SERIAL PRIMARY KEY,
-            product_id INTEGER NOT NULL REFERENCES {schema}.products(id) ON DELETE CASCADE,
-            image_url TEXT NOT NULL,
-            sort_order INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    with transaction() as cursor:
+        # Находим товар по артикулу
+        execute_prepared(cursor, 'product_by_article', f"SELECT id, name FROM {schema}.products WHERE article = $1::text LIMIT 1", (article,))
+        result = cursor.fetchone()
+        
+        if not result:
+            return {
+                'statusCode': 404,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({'error': f'Product with article {article} not found'}),
+                'isBase64Encoded': False
+            }
+        
+        product_id = result[0]
+        
+        version = bump_catalog_version(cursor, schema)
+        
+        # Удаляем старые изображения для этого товара
+        cursor.execute(f"DELETE FROM {schema}.product_images WHERE product_id = %s", (product_id,))
+        
+        # Добавляем новые изображения одним INSERT
+        execute_values(
+            cursor,
+            f"INSERT INTO {schema}.product_images (product_id, image_url, sort_order) VALUES %s",
+            [(product_id, img_url, idx) for idx, img_url in enumerate(images)]
+        )
+        
+        # Галерея — часть карточки товара: помечаем его изменённым для ?changed_since
+        cursor.execute(
+            f"UPDATE {schema}.products SET changed_version = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+            (version, product_id)
         )
-    """)
-    
-    # Удаляем старые изображения для этого товара
-    cursor.execute(f"DELETE FROM {schema}.product_images WHERE product_id = {product_id}")
-    
-    # Добавляем новые изображения
-    for idx, img_url in enumerate(images):
-        safe_url = img_url.replace("'", "''")
-        cursor.execute(f"INSERT INTO {schema}.product_images (product_id, image_url, sort_order) VALUES ({product_id}, '{safe_url}', {idx})")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
     
     return {
         'statusCode': 200,
@@ -133,51 +125,64 @@ def handler(event: dict, context) -> dict:
                 'isBase64Encoded': False
             }
         
-        # Подключаемся к базе данных
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
-        cursor = conn.cursor()
-        
-        # Очищаем таблицу только если явно указано
-        if body.get('clear_existing', False):
-            cursor.execute(f"DELETE FROM {schema}.products")
-        
-        # Вставляем товары
-        inserted = 0
         schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
         
-        for product in products:
-            article = product.get('article', '').replace("'", "''")
-            name = product.get('name', '').replace("'", "''")
-            category = product.get('category', '').replace("'", "''")
-            dimensions = product.get('dimensions', '').replace("'", "''")
-            image_url = product.get('image', '').replace("'", "''")
-            price_str = product.get('price', '')
-            unit = product.get('unit', 'шт').replace("'", "''")
+        # Транзакция на модульном соединении: commit при выходе из блока
+        with transaction() as cursor:
+            version = bump_catalog_version(cursor, schema)
+            
+            # Очищаем таблицу только если явно указано; удалённые артикулы уходят в надгробия
+            if body.get('clear_existing', False):
+                cursor.execute(f"""
+                    WITH deleted AS (
+                        DELETE FROM {schema}.products RETURNING article
+                    )
+                    INSERT INTO {schema}.product_tombstones (article, deleted_version)
+                    SELECT article, %s FROM deleted
+                    ON CONFLICT (article) DO UPDATE SET
+                        deleted_version = EXCLUDED.deleted_version,
+                        deleted_at = CURRENT_TIMESTAMP
+                """, (version,))
             
-            # Пропускаем если нет имени
-            if not name:
-                continue
+            # Собираем строки и вставляем их пачками с bound-параметрами
+            rows = []
             
-            # Конвертируем цену в число
-            price = 0
-            if price_str:
-                try:
-                    price = int(float(price_str))
-                except:
-                    pass
+            for product in products:
+                name = product.get('name', '')
+                price_str = product.get('price', '')
+                
+                # Пропускаем если нет имени
+                if not name:
+                    continue
+                
+                # Конвертируем цену в число
+                price = 0
+                if price_str:
+                    try:
+                        price = int(float(price_str))
+                    except:
+                        pass
+                
+                # Товар с image_url и unit
+                rows.append((
+                    product.get('article', ''),
+                    name,
+                    product.get('category', ''),
+                    product.get('dimensions', ''),
+                    price,
+                    product.get('image', ''),
+                    product.get('unit', 'шт'),
+                    version
+                ))
             
-            # Вставляем товар с image_url и unit
-            cursor.execute(f"""
-                INSERT INTO {schema}.products (article, name, category, dimensions, price, image_url, unit)
-                VALUES ('{article}', '{name}', '{category}', '{dimensions}', {price}, '{image_url}', '{unit}')
-            """)
-            inserted += 1
+            execute_values(cursor, f"""
+                INSERT INTO {schema}.products (article, name, category, dimensions, price, image_url, unit, changed_version)
+                VALUES %s
+            """, rows, page_size=500)
+            inserted = len(rows)
         
-        # Сохраняем изменения
-        conn.commit()
-        cursor.close()
-        conn.close()
+        # Статические JSON каталога для CDN
+        publish_catalog_safely(schema)
         
         return {
             'statusCode': 200,
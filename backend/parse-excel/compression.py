@@ -0,0 +1,78 @@
+import base64
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Ответы меньше порога не сжимаем: выигрыш не окупает заголовки и CPU
+MIN_COMPRESS_SIZE = 1024
+
+# Уже сжатые форматы (xlsx — это zip, картинки) повторно не жмём
+INCOMPRESSIBLE_TYPES = (
+    'application/vnd.openxmlformats',
+    'application/zip',
+    'image/',
+)
+
+
+def negotiate_encoding(event: dict):
+    '''Выбор кодировки по Accept-Encoding: br, если доступен brotli, иначе gzip'''
+    header = ''
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == 'accept-encoding':
+            header = value or ''
+            break
+    
+    accepted = {}
+    for part in header.split(','):
+        token, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if token:
+            accepted[token.strip().lower()] = quality
+    
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def encode_response(response: dict, encoding) -> dict:
+    '''Сжимает тело готового ответа функции выбранной кодировкой'''
+    headers = response.setdefault('headers', {})
+    content_type = headers.get('Content-Type', '')
+    if content_type.startswith(INCOMPRESSIBLE_TYPES):
+        return response
+    
+    headers['Vary'] = 'Accept-Encoding'
+    if encoding is None:
+        return response
+    
+    body = response.get('body') or ''
+    if response.get('isBase64Encoded'):
+        raw = base64.b64decode(body)
+    else:
+        raw = body.encode('utf-8')
+    
+    if len(raw) < MIN_COMPRESS_SIZE:
+        return response
+    
+    headers['Content-Encoding'] = encoding
+    response['body'] = base64.b64encode(compress(raw, encoding)).decode('ascii')
+    response['isBase64Encoded'] = True
+    return response
@@ -4,6 +4,7 @@ import urllib.parse
 import xlrd
 import re
 from io import BytesIO
+from compression import negotiate_encoding, encode_response
 
 
 def handler(event: dict, context) -> dict:
@@ -115,7 +116,8 @@ def handler(event: dict, context) -> dict:
                 if article or name:
                     all_products.append(product)
         
-        return {
+        # Весь каталог в JSON — крупный ответ, сжимаем по Accept-Encoding
+        return encode_response({
             'statusCode': 200,
             'headers': {
                 'Content-Type': 'application/json',
@@ -127,7 +129,7 @@ def handler(event: dict, context) -> dict:
                 'products': all_products
             }, ensure_ascii=False),
             'isBase64Encoded': False
-        }
+        }, negotiate_encoding(event))
         
     except Exception as e:
         return {
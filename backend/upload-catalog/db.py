@@ -0,0 +1,94 @@
+import os
+import time
+from contextlib import contextmanager
+import psycopg2
+
+# Соединение живёт на уровне модуля и переиспользуется тёплыми вызовами функции:
+# экземпляр обрабатывает один запрос за раз, так что пул из одного соединения достаточен
+_conn = None
+_last_used = 0.0
+
+# Имена запросов, уже подготовленных (PREPARE) на текущем соединении
+_prepared = set()
+
+# После такого простоя соединение перед выдачей проверяется через SELECT 1
+PING_AFTER_IDLE_SECONDS = 30
+
+
+def _is_alive(conn) -> bool:
+    if conn is None or conn.closed:
+        return False
+    if time.monotonic() - _last_used < PING_AFTER_IDLE_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error as e:
+        print(f'DB connection is stale, reconnecting: {e}')
+        return False
+
+
+def close():
+    '''Закрывает модульное соединение; следующий get_connection откроет новое'''
+    global _conn
+    if _conn is not None and not _conn.closed:
+        try:
+            _conn.close()
+        except psycopg2.Error:
+            pass
+    _conn = None
+    _prepared.clear()
+
+
+def get_connection():
+    '''Живое соединение с БД: переиспользует открытое или подключается заново'''
+    global _conn, _last_used
+    if not _is_alive(_conn):
+        close()
+        _conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    _last_used = time.monotonic()
+    return _conn
+
+
+@contextmanager
+def transaction():
+    '''Курсор в транзакции: commit при успехе, rollback (или переподключение) при ошибке'''
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        yield cursor
+        conn.commit()
+    except Exception:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            close()
+        raise
+    finally:
+        try:
+            cursor.close()
+        except psycopg2.Error:
+            pass
+
+
+def execute_prepared(cursor, name: str, sql: str, params: tuple = ()):
+    '''Выполняет серверный подготовленный запрос: PREPARE один раз на соединение, дальше только EXECUTE'''
+    # Параметры в sql — $1, $2, ...; план переиспользуется тёплыми вызовами, пока живо соединение
+    if name not in _prepared:
+        cursor.execute(f'PREPARE {name} AS {sql}')
+        _prepared.add(name)
+    if params:
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cursor.execute(f'EXECUTE {name}')
+
+
+def bump_catalog_version(cursor, schema: str) -> int:
+    '''Поднимает версию каталога (один раз на транзакцию) и возвращает её'''
+    # Новая версия инвалидирует снимок get-products и помечает изменения для ?changed_since.
+    # Вызывать до первой записи: блокировка строки версии упорядочивает параллельные записи.
+    # Триггеры V0057 в той же транзакции получат эту же версию, а не поднимут её снова
+    execute_prepared(cursor, 'bump_catalog_version', f"SELECT {schema}.catalog_write_version()")
+    return cursor.fetchone()[0]
@@ -4,9 +4,42 @@ import os
 import boto3
 import openpyxl
 import re
-import psycopg2
+from concurrent.futures import wait
+from psycopg2.extras import execute_values, Json
+from db import transaction, execute_prepared, bump_catalog_version
 from io import BytesIO
-import uuid
+import hashlib
+from catalog_publisher import publish_catalog_safely
+from image_renditions import RENDITIONS, generate_renditions, complete_renditions
+
+# Рендиции новых картинок считаются после записи товаров и не дольше дедлайна;
+# не уложившиеся остаются без рендиций до scripts/backfill_renditions.py
+MAX_RENDITION_IMAGES = 20
+RENDITIONS_DEADLINE_SECONDS = 15
+
+
+def render_new_images(s3, schema: str, uploaded: dict) -> dict:
+    '''Полные наборы рендиций для загруженных картинок, у товаров с которыми их нет или не хватает: {URL: {имя: URL}}'''
+    with transaction() as cursor:
+        execute_prepared(cursor, 'image_urls_without_renditions', f"""
+            SELECT DISTINCT image_url
+            FROM {schema}.products
+            WHERE image_url = ANY($1::text[])
+              AND (image_renditions IS NULL OR NOT image_renditions ?& $2::text[])
+        """, (list(uploaded), list(RENDITIONS)))
+        missing = [row[0] for row in cursor.fetchall()]
+    
+    if len(missing) > MAX_RENDITION_IMAGES:
+        print(f'Renditions: {len(missing) - MAX_RENDITION_IMAGES} images left for backfill')
+    pending = {
+        url: generate_renditions(s3, uploaded[url][0], uploaded[url][1])
+        for url in missing[:MAX_RENDITION_IMAGES]
+    }
+    wait([f for p in pending.values() for f in p.futures.values()], timeout=RENDITIONS_DEADLINE_SECONDS)
+    # Недосчитанные и неполные доработают в фоне, но в базу попадут только через backfill
+    ready = {url: complete_renditions(p.result()) for url, p in pending.items() if p.done()}
+    return {url: urls for url, urls in ready.items() if urls}
+
 
 def handler(event: dict, context) -> dict:
     '''Загрузка Excel-файла с каталогом, извлечение изображений и сохранение в базу данных'''
@@ -54,9 +87,6 @@ def handler(event: dict, context) -> dict:
             aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
         )
         
-        # Подключаемся к БД
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cursor = conn.cursor()
         schema = os.environ['MAIN_DB_SCHEMA']
         
         # Парсим Excel
@@ -70,6 +100,9 @@ def handler(event: dict, context) -> dict:
         # Словарь для сопоставления позиций изображений с артикулами
         image_map = {}
         
+        # URL загруженной картинки → (ключ S3, байты) для рендиций после записи
+        uploaded_images = {}
+        
         for sheet in workbook.worksheets:
             sheet_name = sheet.title
             
@@ -86,19 +119,21 @@ def handler(event: dict, context) -> dict:
                     try:
                         img_data = image._data()
                         img_ext = image.format.lower() if hasattr(image, 'format') else 'png'
-                        img_filename = f"catalog-images/{uuid.uuid4()}.{img_ext}"
-                        
-                        # Загружаем изображение в S3
-                        s3.put_object(
-                            Bucket='files',
-                            Key=img_filename,
-                            Body=img_data,
-                            ContentType=f'image/{img_ext}'
-                        )
-                        
-                        # Сохраняем URL и позицию
+                        # Имя по содержимому: та же картинка при повторной загрузке прайса получает
+                        # тот же URL, и защита от пустых обновлений ниже не видит в ней изменения
+                        img_filename = f"catalog-images/{hashlib.sha256(img_data).hexdigest()[:32]}.{img_ext}"
                         img_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{img_filename}"
                         
+                        # Одинаковые картинки в разных строках загружаем один раз
+                        if img_url not in uploaded_images:
+                            s3.put_object(
+                                Bucket='files',
+                                Key=img_filename,
+                                Body=img_data,
+                                ContentType=f'image/{img_ext}'
+                            )
+                            uploaded_images[img_url] = (img_filename, img_data)
+                        
                         # Получаем позицию изображения (строка)
                         anchor = image.anchor
                         if hasattr(anchor, '_from'):
@@ -245,63 +280,92 @@ def handler(event: dict, context) -> dict:
         
         print(f'Total rows to process: {products_count}, mode: {update_mode}')
         
-        if update_mode == 'new':
-            # Удаляем все товары и вставляем новые одним batch
-            cursor.execute(f"DELETE FROM {schema}.products")
+        # Соединение берём только на запись: разбор Excel и загрузка картинок идут без него
+        with transaction() as cursor:
+            version = bump_catalog_version(cursor, schema)
             
-            if rows_to_process:
-                values_parts = []
-                for r in rows_to_process:
-                    sa = r['article'].replace("'", "''")
-                    sn = r['name'].replace("'", "''")
-                    sc = r['category'].replace("'", "''")
-                    sd = r['dimensions'].replace("'", "''")
-                    su = r['unit'].replace("'", "''")
-                    si = r['image_url'].replace("'", "''")
-                    values_parts.append(f"('{sa}', '{sn}', '{sc}', {r['price']}, '{sd}', '{su}', '{si}')")
-                
-                # Вставляем батчами по 500
-                batch_size = 500
-                for i in range(0, len(values_parts), batch_size):
-                    batch = values_parts[i:i+batch_size]
-                    cursor.execute(f"""
-                        INSERT INTO {schema}.products (article, name, category, price, dimensions, unit, image_url)
-                        VALUES {', '.join(batch)}
-                    """)
-                added_count = len(rows_to_process)
-        
-        else:
-            # Режим update: используем INSERT ... ON CONFLICT DO UPDATE
-            if rows_to_process:
-                values_parts = []
-                for r in rows_to_process:
-                    sa = r['article'].replace("'", "''")
-                    sn = r['name'].replace("'", "''")
-                    sc = r['category'].replace("'", "''")
-                    sd = r['dimensions'].replace("'", "''")
-                    su = r['unit'].replace("'", "''")
-                    si = r['image_url'].replace("'", "''")
-                    values_parts.append(f"('{sa}', '{sn}', '{sc}', {r['price']}, '{sd}', '{su}', '{si}')")
+            # Имена картинок — хэш содержимого: для уже встречавшихся рендиции есть в базе,
+            # и режим new не должен терять их вместе с удалёнными строками
+            execute_prepared(cursor, 'renditions_by_image_urls', f"""
+                SELECT DISTINCT ON (image_url) image_url, image_renditions
+                FROM {schema}.products
+                WHERE image_url = ANY($1::text[]) AND image_renditions ?& $2::text[]
+            """, (list(uploaded_images), list(RENDITIONS)))
+            renditions = dict(cursor.fetchall())
+            
+            # Порядок колонок совпадает с INSERT ниже; значения уходят bound-параметрами
+            values = [
+                (r['article'], r['name'], r['category'], r['price'], r['dimensions'], r['unit'], r['image_url'],
+                 Json(renditions[r['image_url']]) if r['image_url'] in renditions else None, version)
+                for r in rows_to_process
+            ]
+            
+            if update_mode == 'new':
+                # Удаляем все товары (с надгробиями для дельты) и вставляем новые одним batch
+                cursor.execute(f"""
+                    WITH deleted AS (
+                        DELETE FROM {schema}.products RETURNING article
+                    )
+                    INSERT INTO {schema}.product_tombstones (article, deleted_version)
+                    SELECT article, %s FROM deleted
+                    ON CONFLICT (article) DO UPDATE SET
+                        deleted_version = EXCLUDED.deleted_version,
+                        deleted_at = CURRENT_TIMESTAMP
+                """, (version,))
                 
-                batch_size = 500
-                for i in range(0, len(values_parts), batch_size):
-                    batch = values_parts[i:i+batch_size]
-                    cursor.execute(f"""
-                        INSERT INTO {schema}.products (article, name, category, price, dimensions, unit, image_url)
-                        VALUES {', '.join(batch)}
+                if values:
+                    # Вставляем батчами по 500
+                    execute_values(cursor, f"""
+                        INSERT INTO {schema}.products (article, name, category, price, dimensions, unit, image_url, image_renditions, changed_version)
+                        VALUES %s
+                    """, values, page_size=500)
+                    added_count = len(rows_to_process)
+            
+            else:
+                # Режим update: используем INSERT ... ON CONFLICT DO UPDATE
+                if values:
+                    # Неизменившиеся строки не трогаем, чтобы повторная загрузка того же
+                    # прайса не раздувала дельту ?changed_since
+                    execute_values(cursor, f"""
+                        INSERT INTO {schema}.products (article, name, category, price, dimensions, unit, image_url, image_renditions, changed_version)
+                        VALUES %s
                         ON CONFLICT (article) DO UPDATE SET
                             name = EXCLUDED.name,
                             category = EXCLUDED.category,
                             price = EXCLUDED.price,
                             dimensions = EXCLUDED.dimensions,
                             unit = EXCLUDED.unit,
-                            image_url = CASE WHEN EXCLUDED.image_url != '' THEN EXCLUDED.image_url ELSE {schema}.products.image_url END
-                    """)
-                updated_count = len(rows_to_process)
+                            image_url = CASE WHEN EXCLUDED.image_url != '' THEN EXCLUDED.image_url ELSE {schema}.products.image_url END,
+                            image_renditions = CASE WHEN EXCLUDED.image_url != '' THEN EXCLUDED.image_renditions ELSE {schema}.products.image_renditions END,
+                            changed_version = EXCLUDED.changed_version,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE ({schema}.products.name, {schema}.products.category, {schema}.products.price,
+                               {schema}.products.dimensions, {schema}.products.unit)
+                              IS DISTINCT FROM
+                              (EXCLUDED.name, EXCLUDED.category, EXCLUDED.price, EXCLUDED.dimensions, EXCLUDED.unit)
+                           OR (EXCLUDED.image_url != '' AND EXCLUDED.image_url IS DISTINCT FROM {schema}.products.image_url)
+                    """, values, page_size=500)
+                    updated_count = len(rows_to_process)
+        
+        # Рендиции новых картинок — отдельным шагом после записи товаров
+        if uploaded_images:
+            try:
+                new_renditions = render_new_images(s3, schema, uploaded_images)
+                if new_renditions:
+                    with transaction() as cursor:
+                        version = bump_catalog_version(cursor, schema)
+                        execute_values(cursor, f"""
+                            UPDATE {schema}.products p
+                            SET image_renditions = v.renditions::jsonb, changed_version = v.version, updated_at = CURRENT_TIMESTAMP
+                            FROM (VALUES %s) AS v(image_url, renditions, version)
+                            WHERE p.image_url = v.image_url AND p.image_renditions IS DISTINCT FROM v.renditions::jsonb
+                        """, [(url, Json(urls), version) for url, urls in new_renditions.items()], page_size=500)
+            except Exception as rendition_error:
+                # Товары уже записаны; без рендиций витрина и КП берут оригинал
+                print(f'Renditions step error: {rendition_error}')
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+        # Статические JSON каталога для CDN
+        publish_catalog_safely(schema, s3)
         
         return {
             'statusCode': 200,
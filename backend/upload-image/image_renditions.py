@@ -0,0 +1,109 @@
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image as PILImage
+from catalog_publisher import cdn_url
+
+# Производные картинки, которые кладутся рядом с оригиналом при загрузке:
+# thumb/card — витрина (WebP), xlsx/pdf — вставка в КП (JPEG). Параметры xlsx и pdf
+# совпадают с XLSX_IMAGE_OPTIONS / PDF_IMAGE_OPTIONS в generate-excel/image_prefetch.py
+RENDITIONS = {
+    'thumb': {'format': 'webp', 'max_dim': 300, 'quality': 80},
+    'card': {'format': 'webp', 'max_dim': 600, 'quality': 85},
+    'xlsx': {'format': 'jpeg', 'max_dim': 1200, 'quality': 100, 'optimize': False, 'dpi': (300, 300)},
+    'pdf': {'format': 'jpeg', 'max_dim': 200, 'quality': 40, 'optimize': True},
+}
+
+CONTENT_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+# Рендиции уже сжаты и под новым ключом не меняются
+RENDITION_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Пул на экземпляр функции: рендиции считаются параллельно, пока идёт остальная работа
+_executor = ThreadPoolExecutor(max_workers=4)
+
+
+def rendition_key(original_key: str, name: str) -> str:
+    '''Ключ рендиции рядом с оригиналом: catalog-images/x.png → catalog-images/x.card.webp'''
+    base, _ = os.path.splitext(original_key)
+    return f"{base}.{name}.{RENDITIONS[name]['format']}"
+
+
+def render(data: bytes, spec: dict) -> bytes:
+    '''Уменьшает картинку по спецификации рендиции; JPEG получает белый фон вместо прозрачности'''
+    image = PILImage.open(io.BytesIO(data))
+    
+    if spec['format'] == 'jpeg':
+        if image.mode in ('RGBA', 'LA', 'P'):
+            rgba = image.convert('RGBA')
+            background = PILImage.new('RGB', rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    
+    # Только уменьшаем: thumbnail не трогает картинки меньше предела
+    image.thumbnail((spec['max_dim'], spec['max_dim']), PILImage.Resampling.LANCZOS)
+    
+    save_args = {'quality': spec['quality']}
+    if spec['format'] == 'jpeg':
+        save_args['optimize'] = spec.get('optimize', False)
+        if spec.get('dpi'):
+            save_args['dpi'] = spec['dpi']
+    else:
+        save_args['method'] = 4
+    
+    output = io.BytesIO()
+    image.save(output, spec['format'].upper(), **save_args)
+    return output.getvalue()
+
+
+def _render_and_upload(s3, original_key: str, data: bytes, name: str) -> str:
+    spec = RENDITIONS[name]
+    key = rendition_key(original_key, name)
+    s3.put_object(
+        Bucket='files',
+        Key=key,
+        Body=render(data, spec),
+        ContentType=CONTENT_TYPES[spec['format']],
+        CacheControl=RENDITION_CACHE_CONTROL
+    )
+    return cdn_url(key)
+
+
+class PendingRenditions:
+    '''Рендиции одной картинки, которые считаются и выгружаются в фоне'''
+    
+    def __init__(self, s3, original_key: str, data: bytes):
+        self.futures = {
+            name: _executor.submit(_render_and_upload, s3, original_key, data, name)
+            for name in RENDITIONS
+        }
+    
+    def done(self) -> bool:
+        return all(future.done() for future in self.futures.values())
+    
+    def result(self, timeout=None) -> dict:
+        '''Ждёт рендиции (не дольше timeout) и возвращает {имя: URL}; неудавшиеся и неуспевшие пропускаются'''
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        urls = {}
+        for name, future in self.futures.items():
+            try:
+                remaining = max(deadline - time.monotonic(), 0) if deadline is not None else None
+                urls[name] = future.result(timeout=remaining)
+            except Exception as e:
+                print(f'Rendition {name} failed: {e!r}')
+        return urls
+
+
+def complete_renditions(urls: dict):
+    '''Набор рендиций для записи в базу: только полный, иначе None — такую картинку досчитает backfill'''
+    return urls if urls and all(name in urls for name in RENDITIONS) else None
+
+
+def generate_renditions(s3, original_key: str, data: bytes) -> PendingRenditions:
+    '''Запускает генерацию всех рендиций картинки, лежащей в S3 под original_key'''
+    return PendingRenditions(s3, original_key, data)
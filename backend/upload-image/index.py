@@ -2,8 +2,15 @@ import json
 import base64
 import os
 import boto3
-import psycopg2
+from psycopg2.extras import Json
+from db import transaction, execute_prepared, bump_catalog_version
 import uuid
+from catalog_publisher import publish_catalog_safely
+from image_renditions import generate_renditions, complete_renditions
+
+# Сколько ответ ждёт рендиции; не успевшие досчитает scripts/backfill_renditions.py
+RENDITIONS_DEADLINE_SECONDS = 5
+
 
 def handler(event: dict, context) -> dict:
     '''Загрузка изображения для товара по артикулу'''
@@ -44,6 +51,35 @@ def handler(event: dict, context) -> dict:
                 'isBase64Encoded': False
             }
         
+        schema = os.environ['MAIN_DB_SCHEMA']
+        
+        # Товар проверяем до загрузки в S3: для несуществующего артикула ничего не выгружаем
+        with transaction() as cursor:
+            print(f'Ищем товар с артикулом: {article} в схеме: {schema}')
+            
+            execute_prepared(cursor, 'product_by_article', f"SELECT id, name FROM {schema}.products WHERE article = $1::text LIMIT 1", (article,))
+            result = cursor.fetchone()
+        
+        if not result:
+            print(f'Товар с артикулом {article} не найден в базе!')
+            return {
+                'statusCode': 404,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({
+                    'success': False,
+                    'error': f'Товар с артикулом {article} не найден'
+                }),
+                'isBase64Encoded': False
+            }
+        
+        product_id = result[0]
+        product_name = result[1]
+        
+        print(f'Товар найден: ID={product_id}, name={product_name}')
+        
         # Декодируем изображение
         image_data = base64.b64decode(base64_content)
         
@@ -70,52 +106,28 @@ def handler(event: dict, context) -> dict:
         
         print(f'Изображение загружено в S3: {img_url}')
         
-        # Обновляем товар в БД
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cursor = conn.cursor()
-        schema = os.environ['MAIN_DB_SCHEMA']
-        
-        safe_article = article.replace("'", "''")
-        safe_url = img_url.replace("'", "''")
-        
-        print(f'Ищем товар с артикулом: {safe_article} в схеме: {schema}')
-        
-        # Проверяем существует ли товар
-        cursor.execute(f"SELECT id, name FROM {schema}.products WHERE article = '{safe_article}' LIMIT 1")
-        result = cursor.fetchone()
-        
-        if not result:
-            print(f'Товар с артикулом {article} не найден в базе!')
-            cursor.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'success': False,
-                    'error': f'Товар с артикулом {article} не найден'
-                }),
-                'isBase64Encoded': False
-            }
-        
-        product_id = result[0]
-        product_name = result[1]
-        
-        print(f'Товар найден: ID={product_id}, name={product_name}')
-        
-        # Обновляем URL изображения
-        update_query = f"UPDATE {schema}.products SET image_url = '{safe_url}' WHERE article = '{safe_article}'"
-        print(f'Выполняю UPDATE: {update_query}')
-        cursor.execute(update_query)
-        
-        print(f'UPDATE выполнен, строк обновлено: {cursor.rowcount}')
+        # Миниатюры витрины и картинки для КП считаются в фоне; ждём их вне транзакции
+        # и не дольше дедлайна. Неполный набор не пишем: товар останется в очереди backfill
+        renditions = complete_renditions(
+            generate_renditions(s3, img_filename, image_data).result(timeout=RENDITIONS_DEADLINE_SECONDS)
+        )
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with transaction() as cursor:
+            version = bump_catalog_version(cursor, schema)
+            
+            # Обновляем URL изображения и его рендиций
+            print(f'Выполняю UPDATE image_url для товара ID={product_id}')
+            execute_prepared(
+                cursor,
+                'set_product_image',
+                f"UPDATE {schema}.products SET image_url = $1::text, image_renditions = $2::jsonb, changed_version = $3::bigint, updated_at = CURRENT_TIMESTAMP WHERE article = $4::text",
+                (img_url, Json(renditions) if renditions else None, version, article)
+            )
+            
+            print(f'UPDATE выполнен, строк обновлено: {cursor.rowcount}')
+        
+        # Статические JSON каталога для CDN
+        publish_catalog_safely(schema, s3)
         
         return {
             'statusCode': 200,
@@ -128,7 +140,8 @@ def handler(event: dict, context) -> dict:
                 'product_id': product_id,
                 'product_name': product_name,
                 'article': article,
-                'image_url': img_url
+                'image_url': img_url,
+                'renditions': renditions or {}
             }, ensure_ascii=False),
             'isBase64Encoded': False
         }
@@ -1,6 +1,6 @@
 import json
 import os
-import psycopg2
+from db import transaction, bump_catalog_version
 
 def handler(event: dict, context) -> dict:
     '''Загрузка изображения для подкатегории по имени'''
@@ -42,51 +42,44 @@ def handler(event: dict, context) -> dict:
             }
         
         # Подключаемся к БД
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cursor = conn.cursor()
         schema = os.environ['MAIN_DB_SCHEMA']
         
-        safe_name = subcategory_name.replace("'", "''")
-        safe_url = image_url.replace("'", "''")
-        
-        print(f'Ищем подкатегорию: {safe_name} в схеме: {schema}')
-        
-        # Проверяем существует ли подкатегория
-        cursor.execute(f"SELECT id, name FROM {schema}.subcategories WHERE name ILIKE '%{safe_name}%' LIMIT 1")
-        result = cursor.fetchone()
-        
-        if not result:
-            print(f'Подкатегория {subcategory_name} не найдена в базе!')
-            cursor.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'success': False,
-                    'error': f'Подкатегория {subcategory_name} не найдена'
-                }),
-                'isBase64Encoded': False
-            }
-        
-        subcat_id = result[0]
-        subcat_name = result[1]
-        
-        print(f'Подкатегория найдена: ID={subcat_id}, name={subcat_name}')
-        
-        # Обновляем URL изображения
-        update_query = f"UPDATE {schema}.subcategories SET image_url = '{safe_url}' WHERE id = {subcat_id}"
-        print(f'Выполняю UPDATE: {update_query}')
-        cursor.execute(update_query)
-        
-        print(f'UPDATE выполнен, строк обновлено: {cursor.rowcount}')
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with transaction() as cursor:
+            print(f'Ищем подкатегорию: {subcategory_name} в схеме: {schema}')
+            
+            # Проверяем существует ли подкатегория
+            cursor.execute(f"SELECT id, name FROM {schema}.subcategories WHERE name ILIKE %s LIMIT 1", (f'%{subcategory_name}%',))
+            result = cursor.fetchone()
+            
+            if not result:
+                print(f'Подкатегория {subcategory_name} не найдена в базе!')
+                return {
+                    'statusCode': 404,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({
+                        'success': False,
+                        'error': f'Подкатегория {subcategory_name} не найдена'
+                    }),
+                    'isBase64Encoded': False
+                }
+            
+            subcat_id = result[0]
+            subcat_name = result[1]
+            
+            print(f'Подкатегория найдена: ID={subcat_id}, name={subcat_name}')
+            
+            # Картинки подкатегорий входят в дерево категорий get-products;
+            # версию берём до записи, как и остальные пути записи
+            bump_catalog_version(cursor, schema)
+            
+            # Обновляем URL изображения
+            print(f'Выполняю UPDATE image_url для подкатегории ID={subcat_id}')
+            cursor.execute(f"UPDATE {schema}.subcategories SET image_url = %s WHERE id = %s", (image_url, subcat_id))
+            
+            print(f'UPDATE выполнен, строк обновлено: {cursor.rowcount}')
         
         return {
             'statusCode': 200,
@@ -0,0 +1,12 @@
+-- Версия каталога: увеличивается каждым путём записи (upload-catalog, load-products,
+-- upload-image, delete-products), get-products по ней инвалидирует снимок в памяти
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id INTEGER PRIMARY KEY DEFAULT 1,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT catalog_version_single_row CHECK (id = 1)
+);
+
+INSERT INTO catalog_version (id, version)
+VALUES (1, 1)
+ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,12 @@
+-- Поиск по каталогу в get-products (?q=): морфология по названию и триграммы
+-- по артикулу/названию для опечаток и частичных совпадений
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_products_name_fts
+    ON products USING GIN (to_tsvector('russian', name));
+
+CREATE INDEX IF NOT EXISTS idx_products_article_trgm
+    ON products USING GIN (article gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm
+    ON products USING GIN (name gin_trgm_ops);
@@ -0,0 +1,16 @@
+-- Дельта-синхронизация каталога (get-products ?changed_since=): каждая запись
+-- помечает товар версией каталога, удаления остаются в product_tombstones
+ALTER TABLE products ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS changed_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_products_changed_version ON products (changed_version);
+CREATE INDEX IF NOT EXISTS idx_products_updated_at ON products (updated_at);
+
+CREATE TABLE IF NOT EXISTS product_tombstones (
+    article VARCHAR(100) PRIMARY KEY,
+    deleted_version BIGINT NOT NULL,
+    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_tombstones_deleted_version ON product_tombstones (deleted_version);
+CREATE INDEX IF NOT EXISTS idx_product_tombstones_deleted_at ON product_tombstones (deleted_at);
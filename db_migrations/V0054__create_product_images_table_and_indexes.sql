@@ -0,0 +1,14 @@
+-- Таблица галерей раньше создавалась из load-products на каждом запросе;
+-- на существующей базе CREATE TABLE ничего не меняет
+CREATE TABLE IF NOT EXISTS product_images (
+    id SERIAL PRIMARY KEY,
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    image_url TEXT NOT NULL,
+    sort_order INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Галерея товара (get-product-images, ?include=gallery в get-products): поиск по product_id
+-- и сортировка по sort_order прямо по индексу, image_url берётся из него же (index-only scan)
+CREATE INDEX IF NOT EXISTS idx_product_images_product_sort
+    ON product_images (product_id, sort_order) INCLUDE (image_url);
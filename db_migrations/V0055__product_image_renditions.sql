@@ -0,0 +1,3 @@
+-- Рендиции картинки товара, сгенерированные при загрузке (upload-image, upload-catalog):
+-- {"thumb": url, "card": url, "xlsx": url, "pdf": url}; NULL — только оригинал
+ALTER TABLE products ADD COLUMN IF NOT EXISTS image_renditions JSONB;
@@ -0,0 +1,4 @@
+-- На products(article) уже есть уникальный products_article_unique (V0043): он же
+-- обслуживает поиск по артикулу, а обычный idx_products_article (V0033) только
+-- удваивал работу каждой записи
+DROP INDEX IF EXISTS idx_products_article;
@@ -0,0 +1,61 @@
+-- Версию каталога поднимают не только функции: правки товаров миграциями (как V0044–V0050)
+-- тоже должны сбросить снимок get-products, его ETag и выложенный на CDN каталог.
+-- Транзакция поднимает версию один раз: номер запоминается в её локальной настройке,
+-- поэтому db.bump_catalog_version и триггеры одной транзакции получают одну и ту же версию
+CREATE OR REPLACE FUNCTION catalog_write_version() RETURNS BIGINT AS $$
+DECLARE
+    write_version BIGINT;
+BEGIN
+    write_version := NULLIF(current_setting('catalog.write_version', true), '')::BIGINT;
+    IF write_version IS NULL THEN
+        UPDATE catalog_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1
+        RETURNING version INTO write_version;
+        PERFORM set_config('catalog.write_version', write_version::TEXT, true);
+    END IF;
+    RETURN write_version;
+END;
+$$ LANGUAGE plpgsql SET search_path FROM CURRENT;
+
+CREATE OR REPLACE FUNCTION catalog_touch() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM catalog_write_version();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SET search_path FROM CURRENT;
+
+-- Изменённый товар помечается версией записи и для дельты ?changed_since,
+-- даже если его правит миграция, а не функция
+CREATE OR REPLACE FUNCTION products_stamp_version() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.changed_version := catalog_write_version();
+    NEW.updated_at := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SET search_path FROM CURRENT;
+
+DROP TRIGGER IF EXISTS products_stamp_version ON products;
+CREATE TRIGGER products_stamp_version
+    BEFORE INSERT OR UPDATE ON products
+    FOR EACH ROW EXECUTE FUNCTION products_stamp_version();
+
+DROP TRIGGER IF EXISTS products_bump_catalog_version ON products;
+CREATE TRIGGER products_bump_catalog_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON products
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_touch();
+
+DROP TRIGGER IF EXISTS product_images_bump_catalog_version ON product_images;
+CREATE TRIGGER product_images_bump_catalog_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON product_images
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_touch();
+
+-- Таблица подкатегорий создана вне миграций, поэтому триггер — только если она есть
+DO $$
+BEGIN
+    IF to_regclass('subcategories') IS NOT NULL THEN
+        DROP TRIGGER IF EXISTS subcategories_bump_catalog_version ON subcategories;
+        CREATE TRIGGER subcategories_bump_catalog_version
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON subcategories
+            FOR EACH STATEMENT EXECUTE FUNCTION catalog_touch();
+    END IF;
+END $$;
@@ -1,23 +1,44 @@
 #!/usr/bin/env python3
 """
-Download and install DejaVuSans.ttf font file
+Download and install DejaVuSans.ttf and DejaVuSans-Bold.ttf font files
+into backend/generate-excel/fonts (bundled with the function, see font_helper.py)
 """
+import shutil
 import subprocess
 import os
 import sys
 
-def download_font():
+FONTS_DIR = "backend/generate-excel/fonts"
+
+FONT_FILES = ["DejaVuSans.ttf", "DejaVuSans-Bold.ttf"]
+
+# System copies are preferred over network downloads
+SYSTEM_FONT_DIRS = ["/usr/share/fonts/truetype/dejavu", "/usr/share/fonts/dejavu"]
+
+def install_from_system(font_name, font_path):
+    for directory in SYSTEM_FONT_DIRS:
+        source = os.path.join(directory, font_name)
+        if os.path.exists(source):
+            shutil.copyfile(source, font_path)
+            print(f"✓ Copied {source}")
+            return True
+    return False
+
+def download_font(font_name="DejaVuSans.ttf"):
     # Create fonts directory
-    fonts_dir = "backend/generate-excel/fonts"
+    fonts_dir = FONTS_DIR
     os.makedirs(fonts_dir, exist_ok=True)
     
-    font_path = os.path.join(fonts_dir, "DejaVuSans.ttf")
+    font_path = os.path.join(fonts_dir, font_name)
+    
+    if install_from_system(font_name, font_path):
+        return True
     
     # Try different URLs
     urls = [
-        "https://github.com/senotrusov/dejavu-fonts-ttf/raw/master/ttf/DejaVuSans.ttf",
-        "https://github.com/prawnpdf/prawn/raw/master/data/fonts/DejaVuSans.ttf",
-        "https://raw.githubusercontent.com/matomo-org/travis-scripts/master/fonts/DejaVuSans.ttf",
+        f"https://github.com/senotrusov/dejavu-fonts-ttf/raw/master/ttf/{font_name}",
+        f"https://cdn.jsdelivr.net/npm/dejavu-fonts-ttf@2.37.3/ttf/{font_name}",
+        f"https://github.com/prawnpdf/prawn/raw/master/data/fonts/{font_name}",
     ]
     
     for url in urls:
@@ -60,5 +81,5 @@ def download_font():
     return False
 
 if __name__ == "__main__":
-    success = download_font()
+    success = all([download_font(font_name) for font_name in FONT_FILES])
     sys.exit(0 if success else 1)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Досчитывает рендиции картинок товаров, которые upload-catalog и upload-image не успели сделать за запрос"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'upload-catalog'))
+
+import boto3
+from psycopg2.extras import execute_values, Json
+from db import transaction, execute_prepared, bump_catalog_version
+from image_renditions import RENDITIONS, generate_renditions, complete_renditions
+from catalog_publisher import publish_catalog_safely
+
+# Сколько картинок записывать в базу одной транзакцией
+BATCH_SIZE = 50
+
+# Ключ S3 оригинала из URL CDN: .../bucket/catalog-images/x.png → catalog-images/x.png
+CDN_BUCKET_MARKER = '/bucket/'
+
+
+def pending_images(schema: str) -> list:
+    with transaction() as cursor:
+        execute_prepared(cursor, 'image_urls_for_backfill', f"""
+            SELECT DISTINCT image_url
+            FROM {schema}.products
+            WHERE image_url LIKE '%' || $1::text || '%'
+              AND (image_renditions IS NULL OR NOT image_renditions ?& $2::text[])
+        """, (CDN_BUCKET_MARKER, list(RENDITIONS)))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def save(schema: str, renditions: dict):
+    with transaction() as cursor:
+        version = bump_catalog_version(cursor, schema)
+        execute_values(cursor, f"""
+            UPDATE {schema}.products p
+            SET image_renditions = v.renditions::jsonb, changed_version = v.version, updated_at = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS v(image_url, renditions, version)
+            WHERE p.image_url = v.image_url AND p.image_renditions IS DISTINCT FROM v.renditions::jsonb
+        """, [(url, Json(urls), version) for url, urls in renditions.items()], page_size=500)
+
+
+def main() -> int:
+    schema = os.environ['MAIN_DB_SCHEMA']
+    s3 = boto3.client('s3',
+        endpoint_url='https://bucket.poehali.dev',
+        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+    )
+
+    urls = pending_images(schema)
+    print(f'Картинок без рендиций: {len(urls)}')
+
+    failed = 0
+    batch = {}
+    for number, url in enumerate(urls, start=1):
+        key = url.split(CDN_BUCKET_MARKER, 1)[1]
+        try:
+            data = s3.get_object(Bucket='files', Key=key)['Body'].read()
+            renditions = complete_renditions(generate_renditions(s3, key, data).result())
+        except Exception as e:
+            print(f'{url}: ошибка: {e}')
+            failed += 1
+            continue
+        if renditions is None:
+            # Часть рендиций не выгрузилась — запишем картинку при следующем запуске
+            print(f'{url}: неполный набор рендиций')
+            failed += 1
+            continue
+        batch[url] = renditions
+
+        if len(batch) >= BATCH_SIZE:
+            save(schema, batch)
+            print(f'{number}/{len(urls)}: записано {len(batch)}')
+            batch = {}
+
+    if batch:
+        save(schema, batch)
+        print(f'{len(urls)}/{len(urls)}: записано {len(batch)}')
+
+    # После записи один раз пересобираем статические JSON каталога
+    if len(urls) > failed:
+        publish_catalog_safely(schema, s3)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
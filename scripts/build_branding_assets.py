@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""Сборка ассетов КП: логотип, печать и подпись ужимаются и получают прозрачный фон заранее"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'generate-excel'))
+
+import branding
+
+
+def main() -> int:
+    os.makedirs(branding.ASSETS_DIR, exist_ok=True)
+
+    failed = []
+    for name, (url, max_size, transparent) in branding.BRANDING_ASSETS.items():
+        try:
+            data = branding.prepare_asset(branding.fetch_source(name), max_size, transparent)
+        except Exception as e:
+            print(f'{name}: {url} — ошибка: {e}')
+            failed.append(name)
+            continue
+
+        with open(branding.asset_path(name), 'wb') as f:
+            f.write(data)
+        print(f'{name}: {len(data)} байт → {branding.asset_path(name)}')
+
+    if failed:
+        print(f'\nНе собраны: {", ".join(failed)}; функция скачает их с CDN при первом КП')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Проверка планов горячих запросов каталога: products и product_images читаются только по индексам"""
+
+import os
+import sys
+import psycopg2
+
+# Узлы плана, которые считаем допустимым доступом к таблице
+INDEX_SCANS = ('Index Scan', 'Index Only Scan', 'Bitmap Heap Scan', 'Bitmap Index Scan')
+
+# Таблицы, полный просмотр которых в этих запросах — регрессия
+CHECKED_TABLES = ('products', 'product_images')
+
+# Запросы дословно из execute_prepared функций ($n-параметры) с типичными значениями.
+# Функции деплоятся по отдельности и общих модулей со скриптом не имеют: меняя
+# SQL горячего запроса в функции, поменяйте его и здесь
+HOT_QUERIES = {
+    'get-product-images: галерея товара': ("""
+        SELECT pi.image_url, pi.sort_order
+        FROM product_images pi
+        JOIN products p ON p.id = pi.product_id
+        WHERE p.article = $1::text
+        ORDER BY pi.sort_order ASC
+    """, ('0110',)),
+    'get-product-images / get-products: галереи списка артикулов': ("""
+        SELECT p.article, array_agg(pi.image_url ORDER BY pi.sort_order)
+        FROM {schema}.product_images pi
+        JOIN {schema}.products p ON p.id = pi.product_id
+        WHERE p.article = ANY($1::text[])
+        GROUP BY p.article
+    """, (['0110', '0111', '0115'],)),
+    'load-products / upload-image: товар по артикулу': ("""
+        SELECT id, name FROM {schema}.products WHERE article = $1::text LIMIT 1
+    """, ('0110',)),
+    'generate-excel: рендиции по артикулам': ("""
+        SELECT image_url, image_renditions
+        FROM {schema}.products
+        WHERE article = ANY($1::text[]) AND image_renditions IS NOT NULL
+    """, (['0110', '0111', '0115'],)),
+    'get-products: дельта по версии каталога': ("""
+        SELECT id, article, name, category, dimensions, price, image_url, description, unit, image_renditions
+        FROM {schema}.products
+        WHERE changed_version > $1::bigint
+        ORDER BY id
+    """, (2 ** 40,)),
+    'get-products: поиск': ("""
+        SELECT id, article, name, category, dimensions, price, image_url, description, unit, image_renditions
+        FROM {schema}.products
+        WHERE to_tsvector('russian', name) @@ plainto_tsquery('russian', $1::text)
+           OR article % $1::text
+           OR article LIKE $2::text
+           OR $1::text <% name
+        ORDER BY
+            (article = $1::text) DESC,
+            ts_rank(to_tsvector('russian', name), plainto_tsquery('russian', $1::text)) * 2
+                + similarity(article, $1::text)
+                + word_similarity($1::text, name) DESC,
+            id
+        LIMIT $3::int
+    """, ('качели', 'качели%', 20)),
+}
+
+
+def walk(plan: dict):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from walk(child)
+
+
+def check(cursor, schema: str) -> list:
+    '''Возвращает список проблем: запрос и таблица, прочитанная не по индексу'''
+    problems = []
+    for number, (title, (sql, params)) in enumerate(HOT_QUERIES.items()):
+        # Как в db.execute_prepared: PREPARE без параметров (% в SQL — оператор, а не плейсхолдер)
+        name = f'hot_query_{number}'
+        cursor.execute(f'PREPARE {name} AS ' + sql.format(schema=schema))
+        cursor.execute(f"EXPLAIN (FORMAT JSON) EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        plan = cursor.fetchone()[0][0]['Plan']
+
+        scans = [(node['Node Type'], node.get('Relation Name')) for node in walk(plan) if node.get('Relation Name')]
+        print(f'{title}:')
+        for node_type, relation in scans:
+            print(f'    {relation}: {node_type}')
+
+        for node_type, relation in scans:
+            if relation in CHECKED_TABLES and node_type not in INDEX_SCANS:
+                problems.append(f'{title}: {relation} читается через {node_type}')
+    return problems
+
+
+def main() -> int:
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
+    cursor = conn.cursor()
+
+    # На маленькой таблице планировщик честно выберет Seq Scan; запрещаем его,
+    # чтобы проверить, что индексный путь вообще есть
+    cursor.execute('SET enable_seqscan = off')
+
+    problems = check(cursor, schema)
+    conn.rollback()
+    conn.close()
+
+    if problems:
+        print('\nЗапросы без индексного доступа:')
+        for problem in problems:
+            print(f'    {problem}')
+        return 1
+
+    print('\nВсе горячие запросы используют индексы')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,7 @@ import { CategoryDialogs } from './catalog/CategoryDialogs';
 import { CategoryGrid } from './catalog/CategoryGrid';
 import { ProductDialog } from './catalog/ProductDialog';
 import { Dialog, DialogContent, DialogHeader, DialogTitle } from '@/components/ui/dialog';
+import { getGallery } from '@/utils/productGallery';
 
 interface SubSubSubcategory {
   name: string;
@@ -219,10 +220,9 @@ export function CatalogSection({
     const article = product.name.split('\n')[0]?.replace('Арт. ', '');
     if (article) {
       try {
-        const response = await fetch(`https://functions.poehali.dev/686e9704-6a8f-429d-a2d2-88f49ab86fd8?article=${article}`);
-        const data = await response.json();
-        if (data.success && data.images.length > 0) {
-          setProductImages(data.images);
+        const images = await getGallery(article);
+        if (images.length > 0) {
+          setProductImages(images);
         }
       } catch (error) {
         console.error('Failed to load product images:', error);
@@ -5,7 +5,7 @@ import { Badge } from '@/components/ui/badge';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import { Input } from '@/components/ui/input';
 import Icon from '@/components/ui/icon';
-import { optimizeImage } from '@/utils/imageOptimizer';
+import { optimizeImage, type ImageRenditions } from '@/utils/imageOptimizer';
 import { CartButton } from './CartButton';
 
 interface Product {
@@ -20,6 +20,7 @@ interface Product {
   dimensions?: string;
   article?: string;
   unit?: string;
+  renditions?: ImageRenditions;
 }
 
 interface Category {
@@ -446,7 +447,7 @@ export function CategoryGrid({
                 >
                   {product.image.startsWith('http') ? (
                     <img 
-                      src={product.image} 
+                      src={product.renditions?.card || product.image} 
                       alt={product.name} 
                       loading="lazy"
                       decoding="async"
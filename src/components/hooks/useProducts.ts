@@ -1,4 +1,6 @@
 import { useState, useEffect } from 'react';
+import { decodeColumnar, isColumnar } from '@/utils/catalogColumnar';
+import type { ImageRenditions } from '@/utils/imageOptimizer';
 
 interface Product {
   id: number;
@@ -12,6 +14,7 @@ interface Product {
   description?: string;
   dimensions?: string;
   unit?: string;
+  renditions?: ImageRenditions;
 }
 
 export function useProducts() {
@@ -21,9 +24,14 @@ export function useProducts() {
   useEffect(() => {
     const loadProducts = async () => {
       try {
-        const response = await fetch('https://functions.poehali.dev/6f221f1d-5b1c-4e9c-afc2-b4a2876203a1');
+        // Колоночный формат в несколько раз компактнее массива объектов
+        const response = await fetch('https://functions.poehali.dev/6f221f1d-5b1c-4e9c-afc2-b4a2876203a1?format=columnar');
         const data = await response.json();
         if (data.success) {
+          if (isColumnar(data)) {
+            data.products = decodeColumnar(data);
+          }
+
           const categoryMap: Record<string, string> = {
             'playground': 'playground',
             'Workout': 'sport',
@@ -224,7 +232,8 @@ export function useProducts() {
               image: p.image,
               description: p.description,
               dimensions: p.dimensions,
-              unit: p.unit || 'шт'
+              unit: p.unit || 'шт',
+              renditions: p.renditions
             };
           }));
         }
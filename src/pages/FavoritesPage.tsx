@@ -4,7 +4,8 @@ import Icon from '@/components/ui/icon';
 import { Link, useNavigate } from 'react-router-dom';
 import { useState, useEffect, useRef } from 'react';
 import { ProductDialog } from '@/components/catalog/ProductDialog';
-import { optimizeImage } from '@/utils/imageOptimizer';
+import { optimizeImage, type ImageRenditions } from '@/utils/imageOptimizer';
+import { getGallery, prefetchGalleries } from '@/utils/productGallery';
 
 const formatPrice = (price: string | number): string => {
   const numPrice = typeof price === 'string' ? parseInt(price.replace(/\s/g, '')) : price;
@@ -21,6 +22,7 @@ interface Product {
   image: string;
   description?: string;
   article?: string;
+  renditions?: ImageRenditions;
 }
 
 interface CartItem {
@@ -54,6 +56,14 @@ export default function FavoritesPage({ favorites, removeFromFavorites, addToCar
   const [currentImageIndex, setCurrentImageIndex] = useState(0);
   const [isContactDialogOpen, setIsContactDialogOpen] = useState(false);
 
+  // Галереи всех избранных товаров одним запросом, чтобы карточки открывались без ожидания
+  useEffect(() => {
+    const articles = favorites
+      .map((product) => product.name.split('\n')[0]?.replace('Арт. ', ''))
+      .filter((article): article is string => Boolean(article));
+    prefetchGalleries(articles).catch((error) => console.error('Failed to prefetch galleries:', error));
+  }, [favorites]);
+
   const handleNavigateToCatalog = () => {
     navigate('/');
   };
@@ -67,10 +77,9 @@ export default function FavoritesPage({ favorites, removeFromFavorites, addToCar
     const article = product.name.split('\n')[0]?.replace('Арт. ', '');
     if (article) {
       try {
-        const response = await fetch(`https://functions.poehali.dev/686e9704-6a8f-429d-a2d2-88f49ab86fd8?article=${article}`);
-        const data = await response.json();
-        if (data.success && data.images.length > 0) {
-          setProductImages(data.images);
+        const images = await getGallery(article);
+        if (images.length > 0) {
+          setProductImages(images);
         }
       } catch (error) {
         console.error('Failed to load product images:', error);
@@ -124,7 +133,7 @@ export default function FavoritesPage({ favorites, removeFromFavorites, addToCar
                 <div className="aspect-[4/3] relative overflow-hidden bg-white flex items-center justify-center">
                   {product.image.startsWith('http') ? (
                     <img 
-                      src={optimizeImage(product.image, 400, 85)} 
+                      src={optimizeImage(product.image, 400, 85, product.renditions)} 
                       alt={product.name}
                       loading="lazy"
                       decoding="async"
@@ -0,0 +1,69 @@
+/**
+ * Декодер колоночного ответа get-products (?format=columnar)
+ *
+ * Контракт: по массиву на поле в `columns`; category и unit — индексы
+ * в `dictionaries`; image, description и renditions разрежены ({ rows, values }),
+ * отсутствующие image и description восстанавливаются пустой строкой.
+ */
+
+import type { ImageRenditions } from '@/utils/imageOptimizer';
+
+export interface CatalogProduct {
+  id: number;
+  article: string;
+  name: string;
+  category: string;
+  dimensions: string | null;
+  price: number | null;
+  image: string;
+  description: string;
+  unit: string;
+  renditions?: ImageRenditions;
+}
+
+interface SparseColumn {
+  rows: number[];
+  values: unknown[];
+}
+
+export interface ColumnarCatalog {
+  format: 'columnar';
+  count: number;
+  columns: Record<string, unknown[] | SparseColumn>;
+  dictionaries: Record<string, unknown[]>;
+}
+
+const DICT_FIELDS = ['category', 'unit'];
+const SPARSE_FIELDS = ['image', 'description', 'renditions'];
+
+// Значения разреженных полей для строк, не попавших в rows
+const SPARSE_DEFAULTS: Record<string, unknown> = { image: '', description: '' };
+
+export function isColumnar(data: unknown): data is ColumnarCatalog {
+  return typeof data === 'object' && data !== null && (data as ColumnarCatalog).format === 'columnar';
+}
+
+/**
+ * Восстанавливает массив товаров из колоночного ответа.
+ * Если запрос был с ?fields=, в объектах будут только запрошенные поля.
+ */
+export function decodeColumnar(data: ColumnarCatalog): Partial<CatalogProduct>[] {
+  const products: Record<string, unknown>[] = Array.from({ length: data.count }, () => ({}));
+
+  for (const [field, column] of Object.entries(data.columns)) {
+    if (SPARSE_FIELDS.includes(field)) {
+      const { rows, values } = column as SparseColumn;
+      if (field in SPARSE_DEFAULTS) {
+        products.forEach((product) => { product[field] = SPARSE_DEFAULTS[field]; });
+      }
+      rows.forEach((row, i) => { products[row][field] = values[i]; });
+    } else if (DICT_FIELDS.includes(field)) {
+      const dictionary = data.dictionaries[field] || [];
+      (column as number[]).forEach((index, row) => { products[row][field] = dictionary[index]; });
+    } else {
+      (column as unknown[]).forEach((value, row) => { products[row][field] = value; });
+    }
+  }
+
+  return products as Partial<CatalogProduct>[];
+}
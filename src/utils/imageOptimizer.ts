@@ -1,16 +1,35 @@
+/**
+ * Готовые копии картинки товара, сгенерированные при загрузке (поле renditions в get-products):
+ * thumb — WebP до 300px, card — WebP до 600px, xlsx / pdf — JPEG для КП
+ */
+export interface ImageRenditions {
+  thumb?: string;
+  card?: string;
+  xlsx?: string;
+  pdf?: string;
+}
+
 /**
  * Оптимизация изображений через CDN с поддержкой WebP
  * @param url - исходный URL изображения
  * @param width - желаемая ширина (опционально)
  * @param quality - качество от 1 до 100 (по умолчанию 85)
+ * @param renditions - готовые копии: если подходящая есть, она отдаётся без ресайза на лету
  */
-export function optimizeImage(url: string, width?: number, quality: number = 85): string {
+export function optimizeImage(url: string, width?: number, quality: number = 85, renditions?: ImageRenditions): string {
   if (!url || !url.startsWith('http')) {
     return url;
   }
 
   const isMobile = typeof window !== 'undefined' ? window.innerWidth < 768 : false;
   const actualWidth = width || (isMobile ? 600 : 1200);
+
+  if (actualWidth <= 300 && renditions?.thumb) {
+    return renditions.thumb;
+  }
+  if (actualWidth <= 600 && renditions?.card) {
+    return renditions.card;
+  }
   const actualQuality = Math.min(quality, 95);
   
   return `https://images.weserv.nl/?url=${encodeURIComponent(url)}&w=${actualWidth}&q=${actualQuality}&output=webp&default=1`;
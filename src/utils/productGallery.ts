@@ -0,0 +1,33 @@
+const PRODUCT_IMAGES_URL = 'https://functions.poehali.dev/686e9704-6a8f-429d-a2d2-88f49ab86fd8';
+
+// Галереи, уже полученные за сессию: артикул → URL картинок по порядку
+const galleryCache = new Map<string, string[]>();
+
+/**
+ * Загружает галереи сразу для списка артикулов одним запросом (?articles=)
+ * и кладёт их в кэш; уже загруженные артикулы повторно не запрашиваются
+ */
+export async function prefetchGalleries(articles: string[]): Promise<void> {
+  const missing = [...new Set(articles.filter((a) => a && !galleryCache.has(a)))];
+  if (missing.length === 0) {
+    return;
+  }
+
+  const response = await fetch(`${PRODUCT_IMAGES_URL}?articles=${encodeURIComponent(missing.join(','))}`);
+  const data = await response.json();
+  if (data.success) {
+    for (const article of missing) {
+      galleryCache.set(article, data.images[article] || []);
+    }
+  }
+}
+
+/**
+ * Галерея товара: из кэша, а если её там нет — через тот же пакетный запрос
+ */
+export async function getGallery(article: string): Promise<string[]> {
+  if (!galleryCache.has(article)) {
+    await prefetchGalleries([article]);
+  }
+  return galleryCache.get(article) || [];
+}